@@ -0,0 +1,1148 @@
+import network_3 as network
+import link_3 as link
+import traffic_3 as traffic
+import contextlib
+import snapshot_3 as snapshot
+import capture_3 as capture
+import replay_3 as replay
+import profile_3 as profile
+import transport_3 as transport
+import clock_3 as clock
+import controller_3 as controller
+import sweep_3 as sweep
+import tempfile
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import types
+
+##configuration parameters
+num_destinations = 10000
+num_neighbors = 3
+num_update_entries = 50000
+num_packets = 1000000
+router_queue_size = 0 #0 means unlimited
+traffic_time = 3
+num_snapshot_routers = 100
+num_areas = 10
+area_routers = 20
+
+
+## discard everything printed by the network objects
+@contextlib.contextmanager
+def quiet():
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+## build the simulation_3.py topology
+# @param ra_rb_cost: cost of the RA-RB link, 1 makes RA-RB-RD and RA-RC-RD equal
+# @param queue_size: router interface queue length, router_queue_size if None
+# @param link_delay: seconds packets spend on every link
+# @param router_kwargs: passed on to every Router
+# @return ({name: Host or Router}, LinkLayer)
+def build_network(ra_rb_cost=6, queue_size=None, link_delay=0, **router_kwargs):
+    node_D = {}
+    for name in ['H1', 'H2', 'H3']:
+        node_D[name] = network.Host(name)
+    for name, cost_D in [('RA', {'H1': {0: 1}, 'RB': {1: ra_rb_cost}, 'H2': {2: 1}, 'RC': {3: 1}}),
+                         ('RB', {'RD': {1: 1}, 'RA': {0: 1}}),
+                         ('RC', {'RA': {0: 1}, 'RD': {1: 1}}),
+                         ('RD', {'H3': {1: 1}, 'RB': {0: 1}, 'RC': {2: 1}})]:
+        node_D[name] = network.Router(name=name, cost_D=cost_D, **router_kwargs,
+                                      max_queue_size=router_queue_size if queue_size is None else queue_size)
+    link_layer = link.LinkLayer()
+    for node_1, intf_1, node_2, intf_2 in [('H1', 0, 'RA', 0), ('RA', 1, 'RB', 0), ('RB', 1, 'RD', 0),
+                                           ('H2', 0, 'RA', 2), ('RA', 3, 'RC', 0), ('RC', 1, 'RD', 2),
+                                           ('RD', 1, 'H3', 0)]:
+        link_layer.add_link(link.Link(node_D[node_1], intf_1, node_D[node_2], intf_2, delay=link_delay))
+    return node_D, link_layer
+
+
+## run objects in their own threads until fn returns, then join them
+def run_threads(object_L, fn):
+    thread_L = [threading.Thread(name=obj.__str__(), target=obj.run) for obj in object_L]
+    for t in thread_L:
+        t.start()
+    try:
+        return fn()
+    finally:
+        for obj in object_L:
+            obj.stop = True
+        for t in thread_L:
+            t.join()
+
+
+## start routing and wait until every router has a route to every host
+def converge(node_D, timeout=30):
+    start = time.perf_counter()
+    node_D['RA'].send_routes(1)
+    router_L = [node for node in node_D.values() if isinstance(node, network.Router)]
+    host_L = [name for name, node in node_D.items() if isinstance(node, network.Host)]
+    while time.perf_counter() - start < timeout:
+        if all(host in router.fastest_D for router in router_L for host in host_L):
+            return time.perf_counter() - start
+        time.sleep(0.01)
+    return None
+
+
+## approximate size of the old {destination: {router: cost}} dict of dicts
+def dict_table_bytes(tbl_D):
+    size = sys.getsizeof(tbl_D)
+    for dest, routers in tbl_D.items():
+        size += sys.getsizeof(dest) + sys.getsizeof(routers)
+        size += sum(sys.getsizeof(cost) for cost in routers.values())
+    return size
+
+
+## build a routing table with num_neighbors rows over num_destinations columns
+def build_table(name='R0'):
+    tbl = network.RoutingTable(name)
+    link_D = {}
+    for n in range(num_neighbors):
+        neighbor = 'N%d' % n
+        tbl.set_direct(neighbor, n + 1)
+        link_D[neighbor] = n + 1
+        tbl.set_row(neighbor, {'D%d' % d: (d + n) % 17 for d in range(num_destinations)})
+    return tbl, link_D
+
+
+## memory per router at num_destinations, dense table versus dict of dicts
+def bench_table_memory():
+    tbl, link_D = build_table()
+    tbl.recompute(link_D)
+    tbl_D = {}
+    for r, router in enumerate(tbl.router_L):
+        for dest, cost in zip(tbl.dest_L, tbl.row_L[r]):
+            if cost < network.INF:
+                tbl_D.setdefault(dest, {})[router] = int(cost)
+    print('destinations: %d, routers: %d' % (len(tbl), len(tbl.router_L)))
+    print('dense table: %d bytes (%.1f per destination)' % (tbl.nbytes(), tbl.nbytes() / len(tbl)))
+    print('dict table:  %d bytes (%.1f per destination)' % (dict_table_bytes(tbl_D), dict_table_bytes(tbl_D) / len(tbl)))
+
+
+## time a full Bellman-Ford column reduction over all neighbor rows
+def bench_recompute():
+    tbl, link_D = build_table()
+    start = time.perf_counter()
+    tbl.recompute(link_D)
+    print('recompute over %d destinations: %.2f ms' % (len(tbl), (time.perf_counter() - start) * 1000))
+
+
+## time relaxing one num_update_entries vector from a neighbor, table-level
+# and through Router.update_routes (output discarded)
+def bench_relax():
+    vector_D = {'D%d' % d: d % 13 for d in range(num_update_entries)}
+    tbl, link_D = build_table()
+    tbl.recompute(link_D)
+    # first advertisement adds the new destinations, the second lowers 1% of costs
+    for label in ['new vector', '1% changed']:
+        start = time.perf_counter()
+        changed = tbl.relax('N0', vector_D, link_D)
+        print('relax %d entries (%s): %.2f ms, %d changed' % \
+            (len(vector_D), label, (time.perf_counter() - start) * 1000, len(changed)))
+        vector_D = {dest: cost - 1 if cost and d % 100 == 0 else cost for d, (dest, cost) in enumerate(vector_D.items())}
+    # tables are rendered by a RouteReporter thread, or not at all without one
+    for reported in [False, True]:
+        vector_D = {'D%d' % d: d % 13 for d in range(num_update_entries)}
+        elapsed_L = []
+        with quiet():
+            router = network.Router('RA', {'RB': {0: 1}, 'RC': {1: 2}}, 0)
+            if reported:
+                router.reporter = network.RouteReporter()
+            for _ in range(2):
+                msg = network.RouterMessage('RB', vector_D)
+                start = time.perf_counter()
+                router.update_routes(msg, 'RB')
+                elapsed_L.append(time.perf_counter() - start)
+                vector_D = {dest: cost - 1 if cost and d % 100 == 0 else cost
+                            for d, (dest, cost) in enumerate(vector_D.items())}
+            if reported:
+                router.reporter.close()
+        print('update_routes %d entries, %s: %.2f ms new vector, %.2f ms 1%% changed' % \
+            (len(vector_D), 'with reporter' if reported else 'no reporter', elapsed_L[0] * 1000, elapsed_L[1] * 1000))
+
+
+## destinations learned from advertisements that each name 1% new ones, as
+# when a large topology comes up; the sorted index is kept up to date
+def bench_discovery():
+    step = max(num_destinations // 100, 1)
+    tbl = network.RoutingTable('RA')
+    link_D = {'RB': 1}
+    vector_D = {}
+    start = time.perf_counter()
+    for d in range(0, num_destinations, step):
+        vector_D.update(('D%d' % k, k % 13) for k in range(d, d + step))
+        tbl.relax('RB', vector_D, link_D)
+    elapsed = time.perf_counter() - start
+    print('%d advertisements, %d destinations learned: %.2f ms' % \
+        (num_destinations // step, len(tbl), elapsed * 1000))
+    start = time.perf_counter()
+    for _ in range(100):
+        tbl.snapshot(['RA', 'RB']).to_text()
+    print('snapshot and print %d destinations: %.2f ms' % (len(tbl), (time.perf_counter() - start) * 10))
+
+
+## one bench_packets variant; run in a fresh process so the peak RSS is its own
+# @param free_max: NetworkPacket.free_max, 0 for no free list
+# @return (seconds, packets allocated, peak RSS in KiB before and after the loop)
+def packet_loop(free_max):
+    pkt_S = network.NetworkPacket('H3', 'data', 'MESSAGE_FROM_H1').to_byte_S()
+    network.NetworkPacket.free_max = free_max
+    network.NetworkPacket.alloc_count = 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for _ in range(num_packets):
+        p = network.NetworkPacket.from_byte_S(pkt_S)
+        p.to_byte_S()
+        p.release()
+    elapsed = time.perf_counter() - start
+    return elapsed, network.NetworkPacket.alloc_count, rss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+## parse, re-encode and release num_packets packets as a router hop does,
+# with and without the packet free list, each in a fresh process
+def bench_packets():
+    for label, size in [('free list', network.NetworkPacket.free_max), ('no free list', 0)]:
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            elapsed, allocated, start_rss, peak_rss = pool.apply(packet_loop, (size,))
+        print('%s: %d packets in %.2f s, %d allocated, peak RSS %d KiB (%+d KiB over the loop)' % \
+            (label, num_packets, elapsed, allocated, peak_rss, peak_rss - start_rss))
+    print('packet object: %d bytes' % sys.getsizeof(network.NetworkPacket('H3', 'data', 'MESSAGE_FROM_H1')))
+
+
+## generated load on the simulation_3.py topology, one pattern at a time
+def bench_traffic():
+    pattern_D = {
+        'constant rate': lambda host_D: [traffic.TrafficGenerator(host_D['H1'], ['H3'], traffic.constant_rate(200))],
+        'poisson': lambda host_D: [traffic.TrafficGenerator(host_D['H1'], ['H3'], traffic.poisson(200), size=(32, 256))],
+        'on/off': lambda host_D: [traffic.TrafficGenerator(host_D['H1'], ['H3'], traffic.on_off(1000, 0.1, 0.2))],
+        'all-to-all': lambda host_D: traffic.all_to_all(
+            [host_D['H1'], host_D['H2'], host_D['H3']], 50, traffic.poisson, seed=1),
+    }
+    for label, make_gen in pattern_D.items():
+        with quiet():
+            node_D, link_layer = build_network()
+            host_D = {name: node for name, node in node_D.items() if isinstance(node, network.Host)}
+            gen_L = make_gen(host_D)
+            def load():
+                if converge(node_D) is None:
+                    return
+                run_threads(gen_L, lambda: time.sleep(traffic_time))
+                time.sleep(0.5) #drain queues
+            run_threads(list(node_D.values()) + [link_layer], load)
+        print('%s: sent %d' % (label, sum(gen.sent for gen in gen_L)))
+        for name, host in host_D.items():
+            host.print_rx_stats(traffic.sent_to(gen_L, name))
+
+
+## hop traces of H1<->H3 traffic: per-flow latency, paths and per-hop delay
+def bench_trace():
+    network.trace_packets = True
+    try:
+        with quiet():
+            node_D, link_layer = build_network()
+            gen_L = [traffic.TrafficGenerator(node_D['H1'], ['H3'], traffic.constant_rate(100)),
+                     traffic.TrafficGenerator(node_D['H3'], ['H1'], traffic.constant_rate(100))]
+            def load():
+                if converge(node_D) is not None:
+                    run_threads(gen_L, lambda: time.sleep(traffic_time))
+                    time.sleep(0.5) #drain queues
+            run_threads(list(node_D.values()) + [link_layer], load)
+    finally:
+        network.trace_packets = False
+    node_D['H3'].print_trace_stats()
+    node_D['H1'].print_trace_stats()
+
+
+## throughput of eight H1->H3 and H2->H3 flows over the RA-RB/RC-RD diamond
+# with equal link costs, single path versus ECMP; the paths come from hop traces
+def bench_ecmp():
+    network.trace_packets = True
+    try:
+        for ecmp in [False, True]:
+            with quiet():
+                node_D, link_layer = build_network(ra_rb_cost=1, ecmp=ecmp)
+                gen_L = [traffic.TrafficGenerator(node_D[src], ['H3'], traffic.constant_rate(25), flow=flow)
+                         for src in ['H1', 'H2'] for flow in range(4)]
+                def load():
+                    if converge(node_D) is not None:
+                        run_threads(gen_L, lambda: time.sleep(traffic_time))
+                        time.sleep(0.5) #drain queues
+                run_threads(list(node_D.values()) + [link_layer], load)
+            stats = node_D['H3'].trace_stats
+            received = sum(hist.count for hist in stats.latency_D.values())
+            print('ecmp %s: sent %d, received %d (%.0f packets/s)' % \
+                (ecmp, sum(gen.sent for gen in gen_L), received, received / traffic_time))
+            path_D = {}
+            for flow_path_D in stats.path_D.values():
+                for path, count in flow_path_D.items():
+                    path_D[path[2]] = path_D.get(path[2], 0) + count
+            for via, count in sorted(path_D.items()):
+                print('    via %s: %d packets' % (via, count))
+    finally:
+        network.trace_packets = False
+
+
+## routing convergence after RA raises its cost to H2 while H1, H2 and H3
+# saturate the network, with FIFO versus scheduled router interfaces; the
+# update has to pass RA's congested interface towards RC
+def bench_convergence_load():
+    # reference forwarding tables after the change, from an unloaded network
+    with quiet():
+        node_D, link_layer = build_network()
+        def change():
+            converge(node_D)
+            node_D['RA'].set_link_cost('H2', 5)
+            time.sleep(2)
+            return {name: node.rt_tbl.vector() for name, node in node_D.items() if isinstance(node, network.Router)}
+        expected_D = run_threads(list(node_D.values()) + [link_layer], change)
+    for scheduled in [False, True]:
+        with quiet():
+            node_D, link_layer = build_network(scheduled=scheduled)
+            gen_L = [traffic.TrafficGenerator(node_D[src], [dst], traffic.constant_rate(1000), flow=flow)
+                     for flow, (src, dst) in enumerate([('H1', 'H3'), ('H2', 'H3'), ('H3', 'H1')])]
+            def load():
+                if converge(node_D) is None:
+                    return None
+                def change():
+                    time.sleep(3) #let queues build up
+                    start = time.perf_counter()
+                    node_D['RA'].set_link_cost('H2', 5)
+                    while time.perf_counter() - start < 10:
+                        if all(node_D[name].rt_tbl.vector() == vector_D for name, vector_D in expected_D.items()):
+                            return time.perf_counter() - start
+                        time.sleep(0.005)
+                    return None
+                return run_threads(gen_L, change)
+            elapsed = run_threads(list(node_D.values()) + [link_layer], load)
+        backlog = sum(intf.out_queue.qsize() for node in node_D.values()
+                      if isinstance(node, network.Router) for intf in node.intf_L.values())
+        print('scheduled %s: %s, %d packets left in router out queues' % \
+            (scheduled, 'converged in %.3f s' % elapsed if elapsed is not None else 'not converged in 10 s', backlog))
+
+
+## save and restore num_snapshot_routers ring routers with num_destinations
+# routes each
+def bench_snapshot():
+    def ring(n):
+        router_L = []
+        for r in range(n):
+            cost_D = {'R%d' % ((r - 1) % n): {0: 1}, 'R%d' % ((r + 1) % n): {1: 1}}
+            router_L.append(network.Router('R%d' % r, cost_D, router_queue_size))
+        return router_L
+    with quiet():
+        router_L = ring(num_snapshot_routers)
+        for router in router_L:
+            for neighbor in router.link_D:
+                router.rt_tbl.set_row(neighbor, {'D%d' % d: (d + len(neighbor)) % 31 for d in range(num_destinations)})
+            router.update_fastest(router.rt_tbl.recompute(router.link_D))
+        restored_L = ring(num_snapshot_routers)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'routes.snap')
+        start = time.perf_counter()
+        snapshot.save(path, router_L)
+        save_time = time.perf_counter() - start
+        start = time.perf_counter()
+        snapshot.restore(path, restored_L)
+        restore_time = time.perf_counter() - start
+        size = os.path.getsize(path)
+    same = all(a.fastest_D == b.fastest_D and a.rt_tbl.vector() == b.rt_tbl.vector()
+               for a, b in zip(router_L, restored_L))
+    print('%d routers x %d destinations: %.1f MB, save %.2f s, restore %.2f s, identical %s' % \
+        (num_snapshot_routers, num_destinations, size / 1e6, save_time, restore_time, same))
+
+
+## num_areas rings of area_routers routers with a host each; router 0 of
+# every area is a border router on a backbone ring joining the areas
+# @return ({name: Host or Router}, LinkLayer)
+def build_areas(areas):
+    node_D = {}
+    link_L = []
+    name = lambda a, kind, r: '%d.%s%d' % (a % num_areas + 1, kind, r % area_routers)  #areas are numbered from 1
+    for a in range(num_areas):
+        for r in range(area_routers):
+            router = name(a, 'R', r)
+            host = name(a, 'H', r)
+            node_D[host] = network.Host(host)
+            cost_D = {host: {0: 1},
+                      name(a, 'R', r - 1): {1: 1},
+                      name(a, 'R', r + 1): {2: 1}}
+            if r == 0:
+                cost_D[name(a - 1, 'R', 0)] = {3: 1}
+                cost_D[name(a + 1, 'R', 0)] = {4: 1}
+            node_D[router] = network.Router(router, cost_D, router_queue_size, areas=areas)
+            link_L.append((host, 0, router, 0))
+            link_L.append((router, 2, name(a, 'R', r + 1), 1))
+        link_L.append((name(a, 'R', 0), 4, name(a + 1, 'R', 0), 3))
+    link_layer = link.LinkLayer()
+    for node_1, intf_1, node_2, intf_2 in link_L:
+        link_layer.add_link(link.Link(node_D[node_1], intf_1, node_D[node_2], intf_2))
+    return node_D, link_layer
+
+
+## move packets over the links and through routers and hosts in this thread
+# until none are left
+# @return number of steps taken
+def step_until_idle(node_D, link_layer):
+    router_L = [node for node in node_D.values() if isinstance(node, network.Router)]
+    host_L = [node for node in node_D.values() if isinstance(node, network.Host)]
+    steps = 0
+    while True:
+        moved = link_layer.transfer() + sum(router.process_queues() for router in router_L)
+        for host in host_L:
+            while host.intf_L[0].in_queue.qsize():
+                host.udt_receive()
+                moved += 1
+        if not moved:
+            return steps
+        steps += 1
+
+
+## per-router table size and convergence of the area topology, flat versus
+# with areas; links and routers are stepped in this thread until no control
+# packets are left, so the times are CPU time of the routing itself
+def bench_areas():
+    print_packets = link.print_packets
+    link.print_packets = False
+    try:
+        for areas in [False, True]:
+            with quiet():
+                node_D, link_layer = build_areas(areas)
+                router_L = [node for node in node_D.values() if isinstance(node, network.Router)]
+                host_L = [name for name, node in node_D.items() if isinstance(node, network.Host)]
+                start = time.perf_counter()
+                for port in router_L[0].intf_L:
+                    router_L[0].send_routes(port)
+                steps = step_until_idle(node_D, link_layer)
+                elapsed = time.perf_counter() - start
+                reachable = True
+                for router in router_L:
+                    for host in host_L:
+                        try:
+                            router.lookup(host)
+                        except KeyError:
+                            reachable = False
+                # send from the middle of area 1 to a host in every area
+                received_L = []
+                for a in range(1, num_areas + 1):
+                    dst = '%d.H%d' % (a, area_routers // 2)
+                    node_D[dst].add_callback(lambda host, data_S: received_L.append(str(host)))
+                    node_D['1.H%d' % (area_routers // 2)].udt_send(dst, 'MESSAGE_TO_AREA_%d' % a)
+                step_until_idle(node_D, link_layer)
+            size_L = [len(router.rt_tbl) for router in router_L]
+            byte_L = [router.rt_tbl.nbytes() for router in router_L]
+            print('%s, %d routers: converged in %.2f s (%d steps), all hosts reachable %s, '
+                  'packets delivered to %d of %d areas' % \
+                ('areas' if areas else 'flat', len(router_L), elapsed, steps, reachable, len(set(received_L)), num_areas))
+            print('    destinations per router: mean %.1f, max %d; table bytes: mean %d, max %d' % \
+                (sum(size_L) / len(size_L), max(size_L), sum(byte_L) / len(byte_L), max(byte_L)))
+    finally:
+        link.print_packets = print_packets
+
+
+## goodput of H1 -> H3 transfers of large packets over the simulation_3.py
+# topology for several link MTUs, stepped in this thread, and the cost of
+# carrying a num_destinations routing update as fragments
+def bench_mtu():
+    size = 4000
+    count = 2000
+    print_packets = link.print_packets
+    link.print_packets = False
+    try:
+        for mtu in [None, 4096, 1500, 576, 128]:
+            with quiet():
+                node_D, link_layer = build_network()
+                node_D['RA'].send_routes(1)
+                step_until_idle(node_D, link_layer)
+                link_layer.set_mtu(mtu)
+                start = time.perf_counter()
+                for seq in range(count):
+                    node_D['H1'].udt_send('H3', network.traffic_payload('H1', 0, seq, size))
+                steps = step_until_idle(node_D, link_layer)
+                elapsed = time.perf_counter() - start
+            stats = node_D['H3'].rx_stats_D[('H1', '0')]
+            print('MTU %s: %.1f MB/s goodput, %d packets delivered, %d lost, %d steps' % \
+                (mtu, stats.received * size / elapsed / 1e6, stats.received, stats.lost(count), steps))
+    finally:
+        link.print_packets = print_packets
+    vector_D = {'D%d' % d: d % 13 for d in range(num_destinations)}
+    pkt_S = network.NetworkPacket(0, 'control', network.RouterMessage('RA', vector_D).to_byte_S()).to_byte_S()
+    for mtu in [1500, 9000]:
+        start = time.perf_counter()
+        frag_L = network.fragment(pkt_S, mtu)
+        reassembler = network.Reassembler()
+        for frag_S in frag_L:
+            whole_S = reassembler.add(network.NetworkPacket.from_byte_S(frag_S))
+        elapsed = time.perf_counter() - start
+        print('routing update of %d characters at MTU %d: %d fragments, split and reassembled in %.2f ms, intact %s' % \
+            (len(pkt_S), mtu, len(frag_L), elapsed * 1000, whole_S == pkt_S))
+
+
+## goodput of a reliable H1 -> H3 transfer for several windows and router
+# queue sizes; the GIL switch interval is shortened so a packet does not wait
+# a full interval for every busy-looping thread at each hop
+def bench_transport():
+    data_S = 'x' * 20000
+    print_packets = link.print_packets
+    link.print_packets = False
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(0.0002)
+    try:
+        for queue_size in [0, 4]:
+            for window in [1, 4, 16, 64]:
+                with quiet():
+                    node_D, link_layer = build_network(queue_size=queue_size)
+                    receiver = transport.ReliableReceiver(transport.Endpoint(node_D['H3']), window=window)
+                    sender = transport.ReliableSender(transport.Endpoint(node_D['H1']), 'H3', data_S, window=window)
+                    def wait():
+                        start = time.perf_counter()
+                        while not sender.done() and time.perf_counter() - start < 60:
+                            time.sleep(0.01)
+                    def transfer():
+                        if converge(node_D) is not None:
+                            run_threads([sender], wait)
+                    run_threads(list(node_D.values()) + [link_layer], transfer)
+                goodput = sender.goodput()
+                print('queue %d, window %2d: %s, %d segments sent, %d retransmitted, intact %s' % \
+                    (queue_size, window, 'not done' if goodput is None else '%.1f kB/s' % (goodput / 1e3),
+                     sender.sent, sender.retransmitted, receiver.data('H1') == data_S))
+    finally:
+        link.print_packets = print_packets
+        sys.setswitchinterval(switch_interval)
+
+
+## four concurrent reliable flows from H1 and H2 into H3 over bounded router
+# queues, with fixed windows and with AIMD reacting to ECN marks and loss
+def bench_congestion():
+    data_S = 'x' * 10000
+    print_packets = link.print_packets
+    link.print_packets = False
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(0.0002)
+    try:
+        for label, ecn_threshold, make_cc in [('fixed window 32', None, lambda: None),
+                                              ('AIMD + ECN', 3, transport.AIMD)]:
+            with quiet():
+                node_D, link_layer = build_network(queue_size=8, ecn_threshold=ecn_threshold)
+                endpoint_D = {name: transport.Endpoint(node_D[name]) for name in ['H1', 'H2', 'H3']}
+                sender_L = []
+                for port, src in enumerate(['H1', 'H1', 'H2', 'H2']):
+                    transport.ReliableReceiver(endpoint_D['H3'], port, window=32)
+                    sender_L.append(transport.ReliableSender(endpoint_D[src], 'H3', data_S, port, window=32, cc=make_cc()))
+                def wait():
+                    start = time.perf_counter()
+                    while not all(sender.done() for sender in sender_L) and time.perf_counter() - start < 120:
+                        time.sleep(0.01)
+                def transfer():
+                    if converge(node_D) is not None:
+                        start = time.perf_counter()
+                        run_threads(sender_L, wait)
+                        return time.perf_counter() - start
+                elapsed = run_threads(list(node_D.values()) + [link_layer], transfer)
+            goodput_L = [sender.goodput() or 0.0 for sender in sender_L]
+            fairness = sum(goodput_L) ** 2 / (len(goodput_L) * sum(g * g for g in goodput_L)) if any(goodput_L) else 0
+            sent = sum(sender.sent for sender in sender_L)
+            print('%s: %d/%d flows done in %.1f s, aggregate %.1f kB/s, Jain fairness %.2f' % \
+                (label, sum(sender.done() for sender in sender_L), len(sender_L), elapsed or 0,
+                 len(data_S) * sum(sender.done() for sender in sender_L) / (elapsed or 1) / 1e3, fairness))
+            print('    per flow kB/s: %s' % ' '.join('%.1f' % (g / 1e3) for g in goodput_L))
+            print('    %d segments sent, %d retransmitted, %d packets marked, %d lost on links' % \
+                (sent, sum(sender.retransmitted for sender in sender_L),
+                 sum(node.marked for node in node_D.values() if isinstance(node, network.Router)),
+                 sum(l.lost for l in link_layer.link_L)))
+    finally:
+        link.print_packets = print_packets
+        sys.setswitchinterval(switch_interval)
+
+
+## CPU burnt by an idle host polling its interface versus waiting on it, and
+# the rate at which a consumer thread gets payloads through a Receiver
+def bench_receive():
+    class Poller:
+        def __init__(self, host):
+            self.host = host
+            self.stop = False
+        def run(self):
+            while not self.stop:
+                self.host.udt_receive()
+    host = network.Host('H1')
+    for label, runner in [('polling', Poller(host)), ('waiting', host)]:
+        start = time.process_time()
+        with quiet():
+            run_threads([runner], lambda: time.sleep(1))
+        print('idle host, %s: %.2f s CPU per second' % (label, time.process_time() - start))
+    count = num_packets // 10
+    pkt_S = network.NetworkPacket('H1', 'data', 'MESSAGE_FROM_H3').to_byte_S()
+    for label, batch in [('get_batch(1)', 1), ('get_batch(256)', 256), ('iterator', None)]:
+        host = network.Host('H1')
+        receiver = network.Receiver(host)
+        def consume():
+            for _ in range(count):
+                host.intf_L[0].put(pkt_S, 'in')
+            got = 0
+            if batch is None:
+                for data_S in receiver:
+                    got += 1
+                    if got == count:
+                        break
+            else:
+                while got < count:
+                    got += len(receiver.get_batch(batch))
+        with quiet():
+            start = time.perf_counter()
+            run_threads([host], consume)
+            elapsed = time.perf_counter() - start
+        print('consumer %s: %d payloads in %.2f s, %.0f per second' % (label, count, elapsed, count / elapsed))
+
+
+## a binary tree of 15 routers R1..R15 with two hosts on every leaf router
+# and host H0 on the root
+# @return ({name: Host or Router}, LinkLayer)
+def build_tree():
+    node_D = {'H0': network.Host('H0')}
+    link_L = [('H0', 0, 'R1', 0)]
+    for r in range(1, 16):
+        cost_D = {}
+        if r == 1:
+            cost_D['H0'] = {0: 1}
+        else:
+            cost_D['R%d' % (r // 2)] = {0: 1}
+        for c, child in enumerate([2 * r, 2 * r + 1]):
+            if r < 8:
+                cost_D['R%d' % child] = {c + 1: 1}
+                link_L.append(('R%d' % r, c + 1, 'R%d' % child, 0))
+            else:
+                host = 'H%d' % (2 * (r - 8) + c + 1)
+                node_D[host] = network.Host(host)
+                cost_D[host] = {c + 1: 1}
+                link_L.append(('R%d' % r, c + 1, host, 0))
+        node_D['R%d' % r] = network.Router('R%d' % r, cost_D, router_queue_size)
+    link_layer = link.LinkLayer()
+    for node_1, intf_1, node_2, intf_2 in link_L:
+        link_layer.add_link(link.Link(node_D[node_1], intf_1, node_D[node_2], intf_2))
+    return node_D, link_layer
+
+
+## link bytes used to deliver packets from H0 to k of the 16 leaf hosts by
+# repeated unicast and by one multicast group, and delivery to members that
+# joined before any routes existed
+def bench_multicast():
+    count = 100
+    data_S = 'x' * 200
+    byte_L = [0]
+    def count_bytes(link, node_a, node_a_intf, node_b, node_b_intf, pkt_S):
+        if pkt_S[network.NetworkPacket.dst_S_length] == network.NetworkPacket.data_code:
+            byte_L[0] += len(pkt_S)
+    print_packets = link.print_packets
+    link.print_packets = False
+    try:
+        for k in [1, 4, 16]:
+            result_L = []
+            for mode in ['unicast', 'multicast']:
+                with quiet():
+                    node_D, link_layer = build_tree()
+                    node_D['R1'].send_routes(1)
+                    step_until_idle(node_D, link_layer)
+                    member_L = ['H%d' % (h * 16 // k + 1) for h in range(k)]
+                    receiver_L = [network.Receiver(node_D[member]) for member in member_L]
+                    if mode == 'multicast':
+                        for member in member_L:
+                            node_D[member].join('G1')
+                        step_until_idle(node_D, link_layer)
+                    byte_L[0] = 0
+                    link_layer.set_capture(count_bytes)
+                    start = time.perf_counter()
+                    for _ in range(count):
+                        if mode == 'multicast':
+                            node_D['H0'].udt_send('G1', data_S)
+                        else:
+                            for member in member_L:
+                                node_D['H0'].udt_send(member, data_S)
+                    step_until_idle(node_D, link_layer)
+                    elapsed = time.perf_counter() - start
+                delivered = sum(receiver.queue.qsize() for receiver in receiver_L)
+                result_L.append(byte_L[0])
+                print('%2d members, %-9s: %7d link bytes, %d of %d payloads delivered, %.2f s' % \
+                    (k, mode, byte_L[0], delivered, count * k, elapsed))
+            print('%2d members: multicast saves %.0f%% of link bytes' % (k, 100 * (1 - result_L[1] / result_L[0])))
+        for k in [4, 16]:
+            with quiet():
+                node_D, link_layer = build_tree()
+                member_L = ['H%d' % (h * 16 // k + 1) for h in range(k)]
+                receiver_L = [network.Receiver(node_D[member]) for member in member_L]
+                for member in member_L:
+                    node_D[member].join('G1')
+                step_until_idle(node_D, link_layer)
+                node_D['R1'].send_routes(1)
+                step_until_idle(node_D, link_layer)
+                for _ in range(count):
+                    node_D['H0'].udt_send('G1', data_S)
+                step_until_idle(node_D, link_layer)
+            delivered = sum(receiver.queue.qsize() for receiver in receiver_L)
+            print('%2d members joined before routes: %d of %d payloads delivered' % (k, delivered, count * k))
+    finally:
+        link.print_packets = print_packets
+
+
+## CPU time per hop of Router.process_queues for plain data packets, parsed
+# and re-encoded versus cut through
+def bench_cut_through():
+    count = num_packets // 5
+    pkt_S = network.NetworkPacket('H3', 'data', 'MESSAGE_FROM_H1').to_byte_S()
+    for cut_through in [False, True]:
+        with quiet():
+            router = network.Router('RA', {'H1': {0: 1}, 'H3': {1: 1}}, router_queue_size, cut_through=cut_through)
+            elapsed = None
+            for _ in range(3):  #best of three
+                for _ in range(count):
+                    router.intf_L[0].put(pkt_S, 'in')
+                start = time.process_time()
+                while router.process_queues():
+                    pass
+                run_time = time.process_time() - start
+                elapsed = run_time if elapsed is None else min(elapsed, run_time)
+        print('cut_through %s: %.2f us CPU per hop, %d packets forwarded' % \
+            (cut_through, elapsed / count * 1e6, router.intf_L[1].out_queue.qsize()))
+
+
+## failure detection and reconvergence time versus hello interval: the
+# RA-RC link carrying H1 -> H3 traffic goes down, and RA and RD have to route
+# over RA-RB-RD; then it comes back up
+def bench_hello():
+    print_packets = link.print_packets
+    link.print_packets = False
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(0.0002)
+    try:
+        for hello_interval in [0.05, 0.1, 0.2, 0.5]:
+            with quiet():
+                node_D, link_layer = build_network(ra_rb_cost=1, hello_interval=hello_interval)
+                ra, rd = node_D['RA'], node_D['RD']
+                link_D = {frozenset((str(l.node_1), str(l.node_2))): l for l in link_layer.link_L}
+                ra_rc = link_D[frozenset(('RA', 'RC'))]
+                router_L = [node for node in node_D.values() if isinstance(node, network.Router)]
+                def wait_for(condition, timeout=30):
+                    start = time.perf_counter()
+                    while not condition():
+                        if time.perf_counter() - start > timeout:
+                            return None
+                        time.sleep(0.001)
+                    return time.perf_counter() - start
+                def fail():
+                    if converge(node_D) is None:
+                        return None
+                    # make RA send H3 traffic over RA-RC-RD
+                    ra.set_link_cost('RB', 5)
+                    if wait_for(lambda: ra.fastest_D['H3'] == ra.port_D['RC']) is None:
+                        return None
+                    ra_rc.up = False
+                    start = time.perf_counter()
+                    detect = wait_for(lambda: 'RC' in ra.dead_S)
+                    wait_for(lambda: ra.fastest_D.get('H3') == ra.port_D['RB'] and rd.fastest_D.get('H1') == rd.port_D['RB'])
+                    reconverge = time.perf_counter() - start
+                    ra_rc.up = True
+                    start = time.perf_counter()
+                    wait_for(lambda: ra.fastest_D.get('H3') == ra.port_D['RC'])
+                    restore = time.perf_counter() - start
+                    # cut RD off: packets to H3 must be dropped where the route was withdrawn
+                    for pair in [('RB', 'RD'), ('RC', 'RD')]:
+                        link_D[frozenset(pair)].up = False
+                    wait_for(lambda: 'H3' not in ra.fastest_D)
+                    dropped = sum(router.dropped for router in router_L)
+                    for _ in range(10):
+                        node_D['H1'].udt_send('H3', 'MESSAGE_FROM_H1')
+                    wait_for(lambda: sum(router.dropped for router in router_L) >= dropped + 10, 5)
+                    running = len([t for t in threading.enumerate() if t.name in ('RA', 'RB', 'RC', 'RD')])
+                    return detect, reconverge, restore, sum(router.dropped for router in router_L) - dropped, running
+                result = run_threads(list(node_D.values()) + [link_layer], fail)
+            if result is None or result[0] is None:
+                print('hello %.2f s: failure not detected' % hello_interval)
+            else:
+                print('hello %.2f s, dead %.2f s: failure detected in %.2f s, rerouted in %.2f s, restored in %.2f s; '
+                      'RD cut off: %d of 10 packets to H3 dropped, %d of 4 routers running' % ((hello_interval, ra.dead_interval) + result))
+    finally:
+        link.print_packets = print_packets
+        sys.setswitchinterval(switch_interval)
+
+
+## the bench_hello failure on a clock_3.VirtualClock, with 5 ms link delays
+# @return simulated seconds until the failure was detected, rerouted around
+#  and repaired, and the simulated time at the end; None if a phase did not
+#  finish within 100 dead intervals
+def virtual_failure(hello_interval):
+    node_D, link_layer = build_network(ra_rb_cost=1, link_delay=0.005, hello_interval=hello_interval)
+    ra, rd = node_D['RA'], node_D['RD']
+    ra_rc = [l for l in link_layer.link_L if {str(l.node_1), str(l.node_2)} == {'RA', 'RC'}][0]
+    clk = clock.VirtualClock()
+    clock.use(clk, list(node_D.values()) + [link_layer])
+    def wait_for(condition):
+        start = clk.time()
+        while not condition():
+            if clk.time() - start > 100 * ra.dead_interval:
+                return None
+            clk.sleep(hello_interval / 100)
+        return clk.time() - start
+    ra.send_routes(1)
+    if wait_for(lambda: all(host in router.fastest_D for router in (ra, rd) for host in ('H1', 'H2', 'H3'))) is None:
+        return None
+    ra.set_link_cost('RB', 5)
+    if wait_for(lambda: ra.fastest_D['H3'] == ra.port_D['RC']) is None:
+        return None
+    ra_rc.up = False
+    detect = wait_for(lambda: 'RC' in ra.dead_S)
+    reroute = wait_for(lambda: ra.fastest_D.get('H3') == ra.port_D['RB'] and rd.fastest_D.get('H1') == rd.port_D['RB'])
+    ra_rc.up = True
+    restore = wait_for(lambda: ra.fastest_D.get('H3') == ra.port_D['RC'])
+    if None in (detect, reroute, restore):
+        return None
+    return detect, detect + reroute, restore, clk.time()
+
+## cut the stub router off a ring of routers with hellos on a VirtualClock
+# and time how long the ring takes to withdraw the routes to its host
+# @param max_metric: Router max_metric
+# @param limit: simulated seconds to wait for the withdrawal
+# @return (seconds to detect the failure, seconds until no router routes to
+#  HS or None if some still did after limit, highest cost to HS seen)
+def virtual_ring_failure(routers, hello_interval, max_metric, limit=10.0):
+    host_L, router_L, link_layer = sweep.build_ring(routers, 0, 1, 0.001, 0, stub=True,
+                                                    hello_interval=hello_interval, max_metric=max_metric)
+    r1, rs = router_L[0], router_L[-1]
+    clk = clock.VirtualClock()
+    clock.use(clk, host_L + router_L + [link_layer])
+    r1.send_routes(1)
+    clk.sleep(1)
+    if not all('HS' in router.fastest_D for router in router_L):
+        return None
+    cost_L = [0]
+    def wait_for(condition):
+        start = clk.time()
+        while not condition():
+            if clk.time() - start > limit:
+                return None
+            clk.sleep(hello_interval / 10)
+            cost_L[0] = max([cost_L[0]] + [router.rt_tbl.cost('HS') for router in router_L
+                                           if router.rt_tbl.cost('HS') < network.INF])
+        return clk.time() - start
+    [l for l in link_layer.link_L if rs in (l.node_1, l.node_2) and r1 in (l.node_1, l.node_2)][0].up = False
+    detect = wait_for(lambda: 'RS' in r1.dead_S)
+    if detect is None:
+        return None
+    withdraw = wait_for(lambda: not any('HS' in router.fastest_D for router in router_L[:-1]))
+    return detect, None if withdraw is None else detect + withdraw, cost_L[0]
+
+## a reliable H1 -> H3 transfer next to constant-rate H2 -> H3 traffic on a
+# clock_3.VirtualClock, with 5 ms link delays and 16-packet router queues
+# @return (simulated transfer time, segments retransmitted, data intact,
+#  traffic packets received, mean traffic latency)
+def virtual_transfer():
+    node_D, link_layer = build_network(queue_size=16, link_delay=0.005)
+    clk = clock.VirtualClock()
+    clock.use(clk, list(node_D.values()) + [link_layer])
+    node_D['RA'].send_routes(1)
+    clk.sleep(1)
+    data_S = ''.join(random.Random(1).choice('abcdefgh') for _ in range(64 * 1024))
+    receiver = transport.ReliableReceiver(transport.Endpoint(node_D['H3']))
+    sender = transport.ReliableSender(transport.Endpoint(node_D['H1']), 'H3', data_S, window=32, cc=transport.AIMD())
+    generator = traffic.TrafficGenerator(node_D['H2'], ['H3'], traffic.constant_rate(500), count=500)
+    sender.start()
+    generator.start()
+    while not sender.done() and clk.time() < 60:
+        clk.sleep(0.01)
+    clk.sleep(1)
+    stats = node_D['H3'].rx_stats_D[('H2', '0')]
+    return (sender.end_t - sender.start_t, sender.retransmitted, receiver.data('H1') == data_S,
+            stats.received, stats.latency_sum / stats.received)
+
+## wall-clock cost of the hello failure experiment, the same on a 16-router
+# ring with RIP's max_metric of 16, and of a transfer beside generated
+# traffic in virtual time, each run twice to check both runs see the same
+# events at the same times
+def bench_virtual_time():
+    print_packets = link.print_packets
+    link.print_packets = False
+    try:
+        for hello_interval in [0.05, 0.5, 10.0, 60.0]:
+            start = time.perf_counter()
+            with quiet():
+                result_L = [virtual_failure(hello_interval) for _ in range(2)]
+            wall = (time.perf_counter() - start) / 2
+            if result_L[0] is None:
+                print('hello %.2f s: failure not detected' % hello_interval)
+                continue
+            print('hello %.2f s: failure detected in %.2f s, rerouted in %.2f s, restored in %.2f s; '
+                  '%.1f s simulated in %.3f s, %s' % ((hello_interval,) + result_L[0] + \
+                  (wall, 'repeatable' if result_L[0] == result_L[1] else 'runs differ')))
+        start = time.perf_counter()
+        with quiet():
+            result_L = [virtual_ring_failure(16, 0.1, 16) for _ in range(2)]
+        wall = (time.perf_counter() - start) / 2
+        if result_L[0] is None:
+            print('ring of 16, max_metric 16: failure not detected')
+        else:
+            detect, withdraw, peak = result_L[0]
+            print('ring of 16, max_metric 16: stub failure detected in %.2f s, %s, costs counted up to %d; %.3f s wall, %s'
+                  % (detect, 'routes withdrawn in %.2f s' % withdraw if withdraw is not None
+                     else 'routes not withdrawn after 10 s', peak, wall,
+                     'repeatable' if result_L[0] == result_L[1] else 'runs differ'))
+        start = time.perf_counter()
+        with quiet():
+            result_L = [virtual_transfer() for _ in range(2)]
+        wall = (time.perf_counter() - start) / 2
+        print('transfer of 64 kB in %.3f s, %d retransmitted, intact %s; traffic %d of 500 received, '
+              'latency %.1f ms; %.3f s wall, %s' % (result_L[0][:4] + (result_L[0][4] * 1000, wall,
+              'repeatable' if result_L[0] == result_L[1] else 'runs differ')))
+    finally:
+        link.print_packets = print_packets
+
+
+## how fast a Controller reports a node failure and tears the simulation
+# down, and how long a clean shutdown takes, with per-node uptime and CPU
+def bench_shutdown():
+    print_packets = link.print_packets
+    link.print_packets = False
+    try:
+        for fail in [False, True]:
+            with quiet():
+                node_D, link_layer = build_network()
+                ctl = controller.Controller(list(node_D.values()) + [link_layer])
+                ctl.start()
+                converged = converge(node_D)
+                if fail:
+                    def process_queues():
+                        raise Exception('RB: injected failure')
+                    node_D['RB'].process_queues = process_queues
+                start = time.perf_counter()
+                try:
+                    ctl.sleep(1)
+                    failure_S = 'no failure'
+                except controller.NodeFailure as e:
+                    failure_S = '%s reported after %.1f ms' % (e, (time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                clean = ctl.stop()
+                shutdown = time.perf_counter() - start
+            print('%s: converged in %.2f s, %s, %d nodes stopped in %.1f ms%s' % \
+                ('failure' if fail else 'clean', converged, failure_S, len(ctl.runner_L) - len(ctl.stuck_L),
+                 shutdown * 1000, '' if clean else ', %d still running' % len(ctl.stuck_L)))
+            ctl.print_stats()
+    finally:
+        link.print_packets = print_packets
+
+
+## a small parameter sweep run in this process and in a pool of one process
+# per core; both must give the same rows, since every run has its own
+# virtual clock
+def bench_sweep():
+    grid_D = {'routers': [4, 8, 16], 'queue_size': [0, 2]}
+    print_packets = link.print_packets
+    link.print_packets = False
+    try:
+        start = time.perf_counter()
+        with quiet():
+            serial_L = [sweep.simulate(params) for params in sweep.combinations(grid_D)]
+        print('%d runs in this process: %.2f s' % (len(serial_L), time.perf_counter() - start))
+    finally:
+        link.print_packets = print_packets
+    start = time.perf_counter()
+    row_L = sweep.run_sweep(grid_D)
+    print('%d runs on %d processes: %.2f s' % (len(row_L), os.cpu_count(), time.perf_counter() - start))
+    strip = lambda row_L: [dict(row, wall=None) for row in row_L]
+    print('rows identical: %s' % (strip(serial_L) == strip(row_L)))
+    sys.stdout.write(sweep.to_text(row_L, list(grid_D) + sweep.metric_L))
+
+
+## cost per packet of capturing versus printing num_packets link
+# transmissions, then a captured traffic run with link prints off
+def bench_capture():
+    pkt_S = network.NetworkPacket('H3', 'data', 'MESSAGE_FROM_H1').to_byte_S()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'link.pcap')
+        writer = capture.PcapWriter(path)
+        cap = capture.Capture(writer, [capture.prot_filter('data')])
+        wall_link = types.SimpleNamespace(clock=clock.wall_clock)  #Capture only reads the link's clock
+        start = time.perf_counter()
+        for _ in range(num_packets):
+            cap(wall_link, 'RA', 3, 'RC', 0, pkt_S)
+        capture_time = time.perf_counter() - start
+        writer.close()
+        total_time = time.perf_counter() - start
+        print('capture: %.2f us/packet on the link thread, %.2f s until written, %.1f MB, %d frames read back' % \
+            (capture_time / num_packets * 1e6, total_time, os.path.getsize(path) / 1e6,
+             sum(1 for _ in capture.read_pcap(path))))
+        with quiet():
+            start = time.perf_counter()
+            for _ in range(num_packets):
+                print('%s: direction %s-%s -> %s-%s: transmitting packet "%s"' % ('Link RA-3 - RC-0', 'RA', 3, 'RC', 0, pkt_S))
+            print_time = time.perf_counter() - start
+        print('print to /dev/null: %.2f us/packet' % (print_time / num_packets * 1e6))
+
+        path = os.path.join(tmp_dir, 'sim.pcap')
+        print_packets = link.print_packets
+        link.print_packets = False
+        try:
+            with quiet():
+                node_D, link_layer = build_network()
+                writer = capture.PcapWriter(path)
+                link_layer.set_capture(capture.Capture(writer, [capture.dst_filter(['H3'])]))
+                gen_L = [traffic.TrafficGenerator(node_D['H1'], ['H3'], traffic.constant_rate(100))]
+                def load():
+                    if converge(node_D) is not None:
+                        run_threads(gen_L, lambda: time.sleep(traffic_time))
+                        time.sleep(0.5) #drain queues
+                run_threads(list(node_D.values()) + [link_layer], load)
+                writer.close()
+        finally:
+            link.print_packets = print_packets
+        direction_D = {}
+        for _, direction_S, _ in capture.read_pcap(path):
+            direction_D[direction_S] = direction_D.get(direction_S, 0) + 1
+        for direction_S, count in sorted(direction_D.items()):
+            print('    %s: %d frames to H3' % (direction_S, count))
+
+
+## replay a trace on a VirtualClock
+# @return (sends replayed, simulated seconds, packets received, latency sum)
+def virtual_replay(path, speed):
+    node_D, link_layer = build_network(link_delay=0.001)
+    clk = clock.VirtualClock()
+    clock.use(clk, list(node_D.values()) + [link_layer])
+    node_D['RA'].send_routes(1)
+    clk.sleep(1)
+    host_D = {name: node for name, node in node_D.items() if isinstance(node, network.Host)}
+    replayer = replay.TraceReplayer(host_D, path, speed)
+    start = clk.time()
+    replayer.start()
+    clk.sleep(10)
+    stats_L = [stats for name in ['H1', 'H3'] for stats in node_D[name].rx_stats_D.values()]
+    return (replayer.sent, replayer.end_t - start, sum(stats.received for stats in stats_L),
+            sum(stats.latency_sum for stats in stats_L))
+
+## record two seconds of Poisson H1->H3 and H3->H1 sends, then replay the
+# trace through fresh networks at 1x, 4x and full speed, and twice each on a
+# VirtualClock at 1x and 4x
+def bench_replay():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'sends.csv')
+        with quiet():
+            host_L = [network.Host('H1'), network.Host('H3')]
+            recorder = replay.TraceRecorder(path)
+            for host in host_L:
+                recorder.attach(host)
+            gen_L = [traffic.TrafficGenerator(host_L[0], ['H3'], traffic.poisson(100), seed=1),
+                     traffic.TrafficGenerator(host_L[1], ['H1'], traffic.poisson(100), seed=2)]
+            run_threads(gen_L, lambda: time.sleep(2))
+            recorder.close(host_L)
+        print('recorded %d sends' % recorder.count)
+        for speed in [1.0, 4.0, None]:
+            with quiet():
+                node_D, link_layer = build_network()
+                host_D = {name: node for name, node in node_D.items() if isinstance(node, network.Host)}
+                replayer = replay.TraceReplayer(host_D, path, speed)
+                def load():
+                    if converge(node_D) is None:
+                        return None
+                    start = time.perf_counter()
+                    replayer.run()
+                    elapsed = time.perf_counter() - start
+                    time.sleep(1) #drain queues
+                    return elapsed
+                elapsed = run_threads(list(node_D.values()) + [link_layer], load)
+            print('speed %s: replayed %d sends in %.2f s' % (speed, replayer.sent, elapsed))
+            for name in ['H1', 'H3']:
+                node_D[name].print_rx_stats(traffic.sent_to([replayer], name))
+        for speed in [1.0, 4.0]:
+            with quiet():
+                result_L = [virtual_replay(path, speed) for _ in range(2)]
+            sent, elapsed, received, latency_sum = result_L[0]
+            print('speed %s on a virtual clock: replayed %d sends in %.2f s, %d received, latency avg %.3f ms, %s' % \
+                  (speed, sent, elapsed, received, latency_sum / received * 1000 if received else 0,
+                   'repeatable' if result_L[0] == result_L[1] else 'runs differ'))
+
+
+## per-phase router and link layer timing under H1<->H3 load, plus a
+# folded-stack sample file for flamegraphs
+def bench_profile():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'stacks.folded')
+        with quiet():
+            node_D, link_layer = build_network()
+            router_L = [node for node in node_D.values() if isinstance(node, network.Router)]
+            gen_L = [traffic.TrafficGenerator(node_D['H1'], ['H3'], traffic.constant_rate(200)),
+                     traffic.TrafficGenerator(node_D['H3'], ['H1'], traffic.constant_rate(200))]
+            sampler = profile.StackSampler()
+            def load():
+                if converge(node_D) is not None:
+                    prof_L = profile.attach(router_L + [link_layer])
+                    run_threads(gen_L + [sampler], lambda: time.sleep(traffic_time))
+                    return prof_L
+            prof_L = run_threads(list(node_D.values()) + [link_layer], load)
+            sampler.write(path)
+        for prof in prof_L:
+            prof.print_report()
+        print('%d stack samples, %d distinct stacks written' % (sampler.samples, len(sampler.stack_D)))
+        leaf_D = {}
+        for stack_S, count in sampler.stack_D.items():
+            leaf = stack_S.rsplit(';', 1)[-1]
+            leaf_D[leaf] = leaf_D.get(leaf, 0) + count
+        for leaf, count in sorted(leaf_D.items(), key=lambda item: -item[1])[:5]:
+            print('    %6d %s' % (count, leaf))
+
+
+## time a router is blocked copying a num_destinations table for reporting,
+# versus rendering the copy
+def bench_report():
+    with quiet():
+        router = network.Router('RA', {'RN%d' % n: {n: n + 1} for n in range(num_neighbors)}, router_queue_size)
+        for neighbor in router.link_D:
+            router.rt_tbl.set_row(neighbor, {'D%d' % d: d % 17 for d in range(num_destinations)})
+        router.update_fastest(router.rt_tbl.recompute(router.link_D))
+    start = time.perf_counter()
+    snap = router.routes_snapshot()
+    print('snapshot under route_lock: %.2f ms, %d routers, %d destinations' % \
+          ((time.perf_counter() - start) * 1000, len(snap.router_L), len(snap.dest_L)))
+    for fmt in ['to_text', 'to_csv', 'to_json']:
+        start = time.perf_counter()
+        out_S = getattr(snap, fmt)()
+        print('%s: %.2f ms, %d characters' % (fmt, (time.perf_counter() - start) * 1000, len(out_S)))
+
+
+benchmarks = {
+    'table_memory': bench_table_memory,
+    'recompute': bench_recompute,
+    'relax': bench_relax,
+    'discovery': bench_discovery,
+    'packets': bench_packets,
+    'traffic': bench_traffic,
+    'trace': bench_trace,
+    'ecmp': bench_ecmp,
+    'convergence_load': bench_convergence_load,
+    'snapshot': bench_snapshot,
+    'areas': bench_areas,
+    'mtu': bench_mtu,
+    'transport': bench_transport,
+    'congestion': bench_congestion,
+    'receive': bench_receive,
+    'multicast': bench_multicast,
+    'cut_through': bench_cut_through,
+    'hello': bench_hello,
+    'virtual_time': bench_virtual_time,
+    'shutdown': bench_shutdown,
+    'sweep': bench_sweep,
+    'capture': bench_capture,
+    'replay': bench_replay,
+    'profile': bench_profile,
+    'report': bench_report,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or benchmarks.keys():
+        print('== %s' % name)
+        benchmarks[name]()
@@ -0,0 +1,122 @@
+import network_3 as network
+import queue
+import struct
+import threading
+
+## Packet capture in pcap format.
+# Frames are written with the LINKTYPE_USER0 link type; every frame starts
+# with a text pseudo-header 'node_a-intf>node_b-intf ' giving the direction,
+# followed by the packet string as transmitted by the link.
+
+pcap_header = struct.Struct('<IHHiIII')
+record_header = struct.Struct('<IIII')
+pcap_magic = 0xa1b2c3d4
+linktype_user0 = 147
+
+
+## Buffered pcap writer: capture calls only enqueue, a background thread
+# packs and writes the records in batches.
+class PcapWriter:
+
+    ##@param path: pcap file to create
+    # @param snaplen: frames are cut to this many bytes
+    # @param batch: max records packed per write
+    def __init__(self, path, snaplen=65535, batch=4096):
+        self.snaplen = snaplen
+        self.batch = batch
+        self.queue = queue.SimpleQueue()
+        self.count = 0
+        self.file = open(path, 'wb')
+        self.file.write(pcap_header.pack(pcap_magic, 2, 4, 0, 0, snaplen, linktype_user0))
+        self.thread = threading.Thread(name='PcapWriter %s' % path, target=self.run, daemon=True)
+        self.thread.start()
+
+    ## queue one frame; formatting is left to the writer thread
+    # @param rec: (timestamp, node_a, node_a_intf, node_b, node_b_intf, pkt_S)
+    def write(self, rec):
+        self.queue.put(rec)
+
+    ## pack a list of queued records into pcap records
+    def pack(self, rec_L):
+        part_L = []
+        for t, node_a, node_a_intf, node_b, node_b_intf, pkt_S in rec_L:
+            frame = ('%s-%d>%s-%d %s' % (node_a, node_a_intf, node_b, node_b_intf, pkt_S)).encode()
+            sec = int(t)
+            part_L.append(record_header.pack(sec, int((t - sec) * 1e6), min(len(frame), self.snaplen), len(frame)))
+            part_L.append(frame[:self.snaplen])
+        return b''.join(part_L)
+
+    ## thread target writing queued frames until close() queues None
+    def run(self):
+        while True:
+            rec_L = [self.queue.get()]
+            while len(rec_L) < self.batch:
+                try:
+                    rec_L.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = rec_L[-1] is None
+            if done:
+                rec_L.pop()
+            self.file.write(self.pack(rec_L))
+            self.count += len(rec_L)
+            if done:
+                return
+
+    ## write everything queued so far and close the file
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+
+## read a capture file
+# @return generator of (timestamp, direction_S, pkt_S)
+def read_pcap(path):
+    with open(path, 'rb') as f:
+        if pcap_header.unpack(f.read(pcap_header.size))[0] != pcap_magic:
+            raise ValueError('%s: not a pcap file written by PcapWriter' % path)
+        while True:
+            head = f.read(record_header.size)
+            if len(head) < record_header.size:
+                return
+            sec, usec, incl_len, _ = record_header.unpack(head)
+            direction_S, pkt_S = f.read(incl_len).decode().split(' ', 1)
+            yield sec + usec / 1e6, direction_S, pkt_S
+
+
+## Filters: predicates over (link, node_a, node_a_intf, node_b, node_b_intf, pkt_S)
+
+## match packets of one protocol: 'data', 'control', 'fragment', 'membership' or 'hello'
+def prot_filter(prot_S):
+    code = network.NetworkPacket.prot_code_D[prot_S]
+    start = network.NetworkPacket.dst_S_length
+    end = start + network.NetworkPacket.prot_S_length
+    return lambda link, node_a, node_a_intf, node_b, node_b_intf, pkt_S: pkt_S[start:end] in code
+
+## match packets addressed to one of the given destinations
+def dst_filter(dst_L):
+    length = network.NetworkPacket.dst_S_length
+    dst_S = set(str(dst).zfill(length) for dst in dst_L)
+    return lambda link, node_a, node_a_intf, node_b, node_b_intf, pkt_S: pkt_S[:length] in dst_S
+
+## match packets sent by one of the given nodes
+def node_filter(node_L):
+    name_S = set(str(node) for node in node_L)
+    return lambda link, node_a, node_a_intf, node_b, node_b_intf, pkt_S: str(node_a) in name_S
+
+
+## Capture hook for Link.tx_pkt: frames passing every filter go to the writer
+class Capture:
+
+    ##@param writer: PcapWriter receiving the frames
+    # @param filter_L: predicates a frame must all satisfy
+    def __init__(self, writer, filter_L=()):
+        self.writer = writer
+        self.filter_L = list(filter_L)
+
+    def __call__(self, link, node_a, node_a_intf, node_b, node_b_intf, pkt_S):
+        for f in self.filter_L:
+            if not f(link, node_a, node_a_intf, node_b, node_b_intf, pkt_S):
+                return
+        self.writer.write((link.clock.time(), node_a, node_a_intf, node_b, node_b_intf, pkt_S))
@@ -0,0 +1,117 @@
+import heapq
+import itertools
+import threading
+import time
+
+## Clocks giving hosts, routers, links and the link layer their notion of
+# time. Nodes read the time through their clock attribute, which defaults to
+# wall_clock; use() hands a set of nodes another clock.
+#
+# A VirtualClock only moves when it is told to sleep. Nodes using it are not
+# run in threads: sleep() steps them in the calling thread until the network
+# is idle, then jumps straight to the next timer (a hello or dead interval, a
+# link delay, a call_later callback). Timeouts of minutes take no wall-clock
+# time, and since nothing runs concurrently every run of the same experiment
+# sees the same events at the same times.
+
+
+## The wall clock, for nodes run in threads
+class RealClock:
+    stepped = False #nodes run in their own threads
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    ## call fn() from a timer thread after delay seconds
+    def call_later(self, delay, fn):
+        timer = threading.Timer(delay, fn)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+wall_clock = RealClock()
+
+
+## Simulated time, advanced by stepping the nodes attached with use()
+class VirtualClock:
+    stepped = True  #nodes are stepped one after another in the sleeping thread
+
+    ##@param start: time the clock starts at, in seconds
+    def __init__(self, start=0.0):
+        self.now = start
+        self.node_L = []    #nodes stepped while sleeping
+        self.timer_L = []   #heap of (time, order, fn)
+        self.order = itertools.count()  #keeps callbacks due together in call order
+        self.steps = 0  #passes over the nodes so far
+        self.jumps = 0  #times the clock skipped ahead to a timer
+
+    def time(self):
+        return self.now
+
+    ## call fn() once the clock reaches now + delay
+    def call_later(self, delay, fn):
+        heapq.heappush(self.timer_L, (self.now + delay, next(self.order), fn))
+
+    ## run the callbacks that are due
+    # @return number of callbacks run
+    def run_timers(self):
+        count = 0
+        while self.timer_L and self.timer_L[0][0] <= self.now:
+            heapq.heappop(self.timer_L)[2]()
+            count += 1
+        return count
+
+    ## step every node until none of them has anything left to do at the
+    # current time
+    def run_idle(self):
+        while True:
+            moved = self.run_timers()
+            for node in self.node_L:
+                moved += node.step()
+            self.steps += 1
+            if not moved:
+                return
+
+    ## earliest time a timer or node needs the clock, None if nothing waits
+    def next_timer(self):
+        t_L = [self.timer_L[0][0]] if self.timer_L else []
+        for node in self.node_L:
+            t = node.next_timer()
+            if t is not None:
+                t_L.append(t)
+        return min(t_L) if t_L else None
+
+    ## let seconds of simulated time pass, running the network meanwhile
+    def sleep(self, seconds):
+        end = self.now + seconds
+        while True:
+            self.run_idle()
+            t = self.next_timer()
+            if t is None or t > end:
+                break
+            if t > self.now:
+                self.now = t
+                self.jumps += 1
+        self.now = end
+        self.run_idle()
+
+
+## methods a node needs to be given a clock and stepped by a VirtualClock
+node_method_L = ['set_clock', 'step', 'next_timer']
+
+## give nodes (Host, Router, LinkLayer or traffic_3.TrafficGenerator) a
+# clock; a VirtualClock also steps them from then on
+# @raise TypeError: if a node lacks one of node_method_L, before any node
+#  is changed
+def use(clock, node_L):
+    for node in node_L:
+        missing_L = [name for name in node_method_L if not callable(getattr(node, name, None))]
+        if missing_L:
+            raise TypeError('%s cannot run on a clock: it has no %s' % (node, ', '.join(missing_L)))
+    for node in node_L:
+        node.set_clock(clock)
+    if isinstance(clock, VirtualClock):
+        clock.node_L = list(node_L)
@@ -0,0 +1,141 @@
+import clock_3 as clock
+import threading
+import time
+
+## Starts, watches and stops the nodes of a simulation.
+# Every node (Host, Router, LinkLayer, or anything with run() and a stop
+# flag) runs in a NodeRunner thread that records its uptime and CPU time and
+# catches what it raises. The first exception wakes Controller.sleep, which
+# raises NodeFailure in the simulation thread; leaving the with block then
+# stops every node and joins them all within one shared deadline, so a
+# failing node or an exception in the script never leaves threads running.
+#
+#   with controller.Controller(object_L) as ctl:
+#       ctl.sleep(10)
+#   ctl.print_stats()
+#
+# With a clock_3.VirtualClock no threads are started: the nodes are stepped
+# by the clock during sleep() and exceptions propagate directly. Nodes then
+# also need set_clock(), step() and next_timer() (see clock_3.use); start()
+# raises TypeError for nodes without them.
+
+
+## A node raised an exception in its thread
+class NodeFailure(Exception):
+
+    def __init__(self, runner):
+        super().__init__('%s failed: %r' % (runner.name, runner.error))
+        self.runner = runner
+
+
+## Runs one node in a daemon thread
+class NodeRunner:
+
+    def __init__(self, node, on_error):
+        self.node = node
+        self.name = str(node)
+        self.on_error = on_error    #called with this runner when the node raises
+        self.start_t = None
+        self.end_t = None
+        self.cpu = None     #thread CPU seconds, once the node returned
+        self.error = None   #exception the node raised
+        self.thread = threading.Thread(name=self.name, target=self.run, daemon=True)
+
+    ## thread target: run the node, recording its times and failure
+    def run(self):
+        self.start_t = time.time()
+        cpu = time.thread_time()
+        try:
+            self.node.run()
+        except BaseException as e:
+            self.error = e
+            print('%s: failed with %r' % (self.name, e))
+            self.on_error(self)
+        finally:
+            self.cpu = time.thread_time() - cpu
+            self.end_t = time.time()
+
+    ## seconds the node has run for so far
+    def uptime(self):
+        if self.start_t is None:
+            return 0.0
+        return (time.time() if self.end_t is None else self.end_t) - self.start_t
+
+
+class Controller:
+
+    ##@param node_L: nodes to run
+    # @param clock: clock_3.wall_clock to run the nodes in threads, or a
+    #  clock_3.VirtualClock to step them in the calling thread
+    # @param shutdown_timeout: seconds stop() waits for all nodes together
+    def __init__(self, node_L, clock=clock.wall_clock, shutdown_timeout=2.0):
+        self.node_L = list(node_L)
+        self.clock = clock
+        self.shutdown_timeout = shutdown_timeout
+        self.runner_L = []
+        self.failed = threading.Event() #set when a node raised
+        self.failure = None     #first NodeRunner whose node raised
+        self.stuck_L = []   #runners still alive when stop() gave up
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    ## start every node, or attach them to a virtual clock
+    def start(self):
+        if isinstance(self.clock, clock.VirtualClock):
+            clock.use(self.clock, self.node_L)
+            return
+        self.runner_L = [NodeRunner(node, self.node_failed) for node in self.node_L]
+        for runner in self.runner_L:
+            runner.thread.start()
+
+    ## NodeRunner.on_error: remember the first failure and wake sleep()
+    def node_failed(self, runner):
+        if self.failure is None:
+            self.failure = runner
+        self.failed.set()
+
+    ## raise NodeFailure if a node raised
+    def check(self):
+        if self.failure is not None:
+            raise NodeFailure(self.failure) from self.failure.error
+
+    ## let the simulation run for seconds; returns early by raising
+    # NodeFailure as soon as a node fails
+    def sleep(self, seconds):
+        if isinstance(self.clock, clock.VirtualClock):
+            self.clock.sleep(seconds)
+        else:
+            self.failed.wait(seconds)
+        self.check()
+
+    ## stop every node and join them within shutdown_timeout
+    # @return True if every node ended in time
+    def stop(self):
+        for node in self.node_L:
+            node.stop = True
+        deadline = time.perf_counter() + self.shutdown_timeout
+        for runner in self.runner_L:
+            runner.thread.join(max(deadline - time.perf_counter(), 0))
+        self.stuck_L = [runner for runner in self.runner_L if runner.thread.is_alive()]
+        for runner in self.stuck_L:
+            print('%s: still running %.1f s after stop' % (runner.name, self.shutdown_timeout))
+        return not self.stuck_L
+
+    ## per-node run statistics
+    # @return list of (name, uptime seconds, CPU seconds or None, exception or None)
+    def stats(self):
+        return [(runner.name, runner.uptime(), runner.cpu, runner.error) for runner in self.runner_L]
+
+    def print_stats(self):
+        for name, uptime, cpu, error in self.stats():
+            if cpu is None:
+                usage_S = 'running'
+            else:
+                usage_S = 'cpu %.2f s (%.0f%%)' % (cpu, 100 * cpu / uptime if uptime else 0)
+            print('%s: up %.2f s, %s%s' % (name, uptime, usage_S, '' if error is None else ', failed: %r' % error))
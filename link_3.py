@@ -1,5 +1,13 @@
+import clock_3 as clock
+import network_3 as network
+import heapq
+import itertools
 import queue
 import threading
+import time
+
+## print every transmitted packet; turn off for long or captured runs
+print_packets = True
 
 ## An abstraction of a link between router interfaces
 class Link:
@@ -9,36 +17,129 @@ class Link:
     # @param node_1_intf: number of the interface on that node
     # @param node_2: node to which data will be transfered
     # @param node_2_intf: number of the interface on that node
-    def __init__(self, node_1, node_1_intf, node_2, node_2_intf):
+    # @param mtu: largest packet carried, None for unlimited; longer packets
+    #  are fragmented by the sending interface
+    # @param delay: seconds a packet spends on the link, 0 to hand it over
+    #  in the same transfer
+    # @param rate: characters per second each direction transmits, None for
+    #  no limit; a packet holds its direction for len(pkt_S) / rate seconds
+    #  and the next one waits in the sending interface meanwhile
+    def __init__(self, node_1, node_1_intf, node_2, node_2_intf, mtu=None, delay=0, rate=None):
+        if rate is not None and rate <= 0:
+            raise ValueError('link rate must be positive, not %r' % rate)
         self.node_1 = node_1
         self.node_1_intf = node_1_intf
         self.node_2 = node_2
         self.node_2_intf = node_2_intf
+        self.delay = delay
+        self.rate = rate
+        self.busy_L = [0.0, 0.0]   #time each direction finishes its current transmission
+        self.flight_Q = []   #heap of (arrival time, order, node_a, node_a_intf, node_b, node_b_intf, pkt_S) on the link
+        self.order = itertools.count()  #keeps packets arriving together in the order sent
+        self.clock = clock.wall_clock
+        self.capture = None #called with every transmitted packet, see capture_3.Capture
+        self.lost = 0   #packets dropped because the receiving queue was full, they exceeded the MTU or the link was down
+        self.up = True  #a link that is down loses every packet sent over it
+        self.set_mtu(mtu)
         print('Created link %s' % self.__str__())
+
+    ## set the MTU of the link and of the interfaces at both ends
+    def set_mtu(self, mtu):
+        if mtu is not None and mtu < network.min_mtu:
+            raise ValueError('%s: MTU %d leaves no room for data behind the fragment headers, the minimum is %d' % \
+                (self, mtu, network.min_mtu))
+        self.mtu = mtu
+        self.node_1.intf_L[self.node_1_intf].mtu = mtu
+        self.node_2.intf_L[self.node_2_intf].mtu = mtu
         
     ## called when printing the object
     def __str__(self):
         return 'Link %s-%d - %s-%d' % (self.node_1, self.node_1_intf, self.node_2, self.node_2_intf)
         
     ##transmit a packet between interfaces in each direction
-    def tx_pkt(self):
-        for (node_a, node_a_intf, node_b, node_b_intf) in \
-        [(self.node_1, self.node_1_intf, self.node_2, self.node_2_intf), 
-         (self.node_2, self.node_2_intf, self.node_1, self.node_1_intf)]: 
+    # @param prof: optional profile_3.PhaseProfiler timing the transfer phases
+    # @return number of packets moved
+    def tx_pkt(self, prof=None):
+        moved = 0
+        t = None
+        for direction, (node_a, node_a_intf, node_b, node_b_intf) in \
+        enumerate([(self.node_1, self.node_1_intf, self.node_2, self.node_2_intf), 
+                   (self.node_2, self.node_2_intf, self.node_1, self.node_1_intf)]): 
+            if self.rate is not None:
+                now = self.clock.time()
+                if self.busy_L[direction] > now:
+                    continue    #still transmitting the previous packet
             intf_a = node_a.intf_L[node_a_intf]
-            intf_b = node_b.intf_L[node_b_intf]
+            if prof is not None:
+                t = time.perf_counter()
             pkt_S = intf_a.get('out')
+            if prof is not None:
+                t = prof.lap('dequeue', t)
             if pkt_S is None:
                 continue #continue if no packet to transfer
+            if not self.up:
+                self.lost += 1
+                continue
+            if self.mtu is not None and len(pkt_S) > self.mtu:
+                self.lost += 1
+                print('%s: direction %s-%s -> %s-%s: packet longer than MTU %d lost' % \
+                    (self, node_a, node_a_intf, node_b, node_b_intf, self.mtu))
+                continue
+            if self.rate is not None:
+                self.busy_L[direction] = now + len(pkt_S) / self.rate
+                heapq.heappush(self.flight_Q, (self.busy_L[direction] + self.delay, next(self.order),
+                                               node_a, node_a_intf, node_b, node_b_intf, pkt_S))
+                moved += 1
+                continue
+            if self.delay:
+                heapq.heappush(self.flight_Q, (self.clock.time() + self.delay, next(self.order),
+                                               node_a, node_a_intf, node_b, node_b_intf, pkt_S))
+                moved += 1
+                continue
             #otherwise transmit the packet
-            try:
-                intf_b.put(pkt_S, 'in')
+            moved += self.hand_over(node_a, node_a_intf, node_b, node_b_intf, pkt_S, prof, t)
+        if self.flight_Q:
+            now = self.clock.time()
+            while self.flight_Q and self.flight_Q[0][0] <= now:
+                if prof is not None:
+                    t = time.perf_counter()
+                moved += self.hand_over(*heapq.heappop(self.flight_Q)[2:], prof=prof, t=t)
+        return moved
+
+    ## put a transmitted packet into the receiving interface
+    # @param t: perf_counter time the current phase of prof started at
+    # @return 1 if the packet was delivered, 0 if it was lost
+    def hand_over(self, node_a, node_a_intf, node_b, node_b_intf, pkt_S, prof=None, t=None):
+        try:
+            node_b.intf_L[node_b_intf].put(pkt_S, 'in')
+            if prof is not None:
+                t = prof.lap('enqueue', t)
+            if self.capture is not None:
+                self.capture(self, node_a, node_a_intf, node_b, node_b_intf, pkt_S)
+                if prof is not None:
+                    t = prof.lap('capture', t)
+            if print_packets:
                 print('%s: direction %s-%s -> %s-%s: transmitting packet "%s"' % \
                     (self, node_a, node_a_intf, node_b, node_b_intf, pkt_S))
-            except queue.Full:
-                print('%s: direction %s-%s -> %s-%s: packet lost' % \
-                    (self, node_a, node_a_intf, node_b, node_b_intf))
-                pass
+                if prof is not None:
+                    prof.lap('print', t)
+            return 1
+        except queue.Full:
+            self.lost += 1
+            print('%s: direction %s-%s -> %s-%s: packet lost' % \
+                (self, node_a, node_a_intf, node_b, node_b_intf))
+            return 0
+
+    ## arrival time of the next packet on the link, or the time a busy
+    # direction can send the next queued packet; None if neither waits
+    def next_timer(self):
+        t_L = [self.flight_Q[0][0]] if self.flight_Q else []
+        if self.rate is not None:
+            now = self.clock.time()
+            for direction, (node, intf) in enumerate([(self.node_1, self.node_1_intf), (self.node_2, self.node_2_intf)]):
+                if self.busy_L[direction] > now and node.intf_L[intf].out_queue.qsize():
+                    t_L.append(self.busy_L[direction])
+        return min(t_L) if t_L else None
         
         
 ## An abstraction of the link layer
@@ -48,6 +149,8 @@ class LinkLayer:
         ## list of links in the network
         self.link_L = []
         self.stop = False #for thread termination
+        self.profiler = None #per-phase timing, see profile_3.PhaseProfiler
+        self.clock = clock.wall_clock
         
     ## called when printing the object
     def __str__(self):
@@ -55,19 +158,54 @@ class LinkLayer:
     
     ##add a Link to the network
     def add_link(self, link):
+        link.clock = self.clock
         self.link_L.append(link)
+
+    ##capture packets on all links
+    # @param capture: capture_3.Capture, or None to stop capturing
+    def set_capture(self, capture):
+        for link in self.link_L:
+            link.capture = capture
+        
+    ##set the MTU of all links
+    # @param mtu: largest packet carried, None for unlimited
+    def set_mtu(self, mtu):
+        for link in self.link_L:
+            link.set_mtu(mtu)
+        
+    ##time the links by clock, see clock_3
+    def set_clock(self, clock):
+        self.clock = clock
+        for link in self.link_L:
+            link.clock = clock
         
     ##transfer a packet across all links
+    # @return number of packets moved
     def transfer(self):
+        moved = 0
         for link in self.link_L:
-            link.tx_pkt()
+            moved += link.tx_pkt(self.profiler)
+        return moved
+
+    ## one pass of the thread loop, also used to step the links by a
+    # clock_3.VirtualClock
+    # @return number of packets moved
+    def step(self):
+        return self.transfer()
+
+    ## earliest arrival of a packet still on a link, None if none is
+    def next_timer(self):
+        t_L = [t for t in (link.next_timer() for link in self.link_L) if t is not None]
+        return min(t_L) if t_L else None
                 
     ## thread target for the network to keep transmitting data across links
     def run(self):
         print (threading.currentThread().getName() + ': Starting')
         while True:
             #transfer one packet on all the links
-            self.transfer()
+            moved = self.step()
+            if self.profiler is not None:
+                self.profiler.iteration(moved)
             #terminate
             if self.stop:
                 print (threading.currentThread().getName() + ': Ending')
@@ -1,12 +1,30 @@
+import clock_3 as clock
+import stats_3 as stats
 import queue
 import threading
 import operator
 import ast
-from collections import namedtuple
+import io
+import itertools
+import json
+import sys
+import time
+import zlib
+from array import array
+from collections import deque, namedtuple
+from itertools import compress, repeat
+
+INF = float('inf')
+## with hellos and no max_metric, Router caps route costs at this many times
+# its largest link cost (RIP's 16 hops)
+max_metric_hops = 16
+## carry hop traces on data packets sent by hosts; off for throughput runs
+trace_packets = False
 
 class RouterMessage:
+    __slots__ = ('table', 'router_name')
     tbl_len = 30
-    name_length = 5
+    name_length = 8
 
     def __init__(self, router_name, table):
         self.table = table
@@ -25,20 +43,106 @@ class RouterMessage:
         table = ast.literal_eval(table.strip('0'))
         return self(router_name, table)
 
+## Multi-class packet queue: control packets are served with strict priority,
+# data packets by deficit round robin among flows (one flow per destination).
+# The two classes are bounded separately, so a queue full of data still
+# takes routing updates and hellos.
+# put/get/qsize mirror queue.Queue so it can stand in for the FIFO queues.
+class ScheduledQueue:
+
+    ## @param maxsize - the maximum number of queued data packets, 0 for unlimited
+    # @param quantum - characters a data flow may send per round
+    # @param weight_D - {destination: weight} scaling the quantum per flow
+    # @param control_maxsize - the maximum number of queued control packets,
+    #  maxsize if None
+    def __init__(self, maxsize=0, quantum=64, weight_D=None, control_maxsize=None):
+        if quantum <= 0:
+            raise ValueError('quantum must be positive, not %r' % quantum)
+        for dest, weight in (weight_D or {}).items():
+            if weight <= 0:
+                raise ValueError('weight of flow %s must be positive, not %r' % (dest, weight))
+        self.maxsize = maxsize
+        self.control_maxsize = maxsize if control_maxsize is None else control_maxsize
+        self.quantum = quantum
+        self.weight_D = weight_D or dict()
+        self.control = deque()
+        self.flow_D = dict()        # {destination: deque of packets}
+        self.deficit_D = dict()     # {destination: characters it may still send}
+        self.active = deque()       # flows with packets, in round-robin order
+        self.size = 0
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.not_full = threading.Condition(self.mutex)
+
+    def qsize(self):
+        return self.size
+
+    def put(self, pkt_S, block=True, timeout=None):
+        control = is_control(pkt_S)
+        if control:
+            maxsize, count = self.control_maxsize, lambda: len(self.control)
+        else:
+            maxsize, count = self.maxsize, lambda: self.size - len(self.control)
+        with self.not_full:
+            if maxsize > 0 and count() >= maxsize:
+                if not block or not self.not_full.wait_for(lambda: count() < maxsize, timeout):
+                    raise queue.Full
+            if control:
+                self.control.append(pkt_S)
+            else:
+                flow = pkt_S[:NetworkPacket.dst_S_length]
+                if flow not in self.flow_D:
+                    self.flow_D[flow] = deque()
+                if not self.flow_D[flow]:
+                    self.active.append(flow)
+                    self.deficit_D[flow] = 0
+                self.flow_D[flow].append(pkt_S)
+            self.size += 1
+            self.not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        with self.not_empty:
+            if self.size == 0:
+                if not block or not self.not_empty.wait_for(lambda: self.size > 0, timeout):
+                    raise queue.Empty
+            self.size -= 1
+            self.not_full.notify_all()  #waiters of either class
+            if self.control:
+                return self.control.popleft()
+            while True:
+                flow = self.active[0]
+                pkt_L = self.flow_D[flow]
+                if self.deficit_D[flow] < len(pkt_L[0]):
+                    self.deficit_D[flow] += self.quantum * self.weight_D.get(flow.lstrip('0'), 1)
+                    self.active.rotate(-1)
+                    continue
+                pkt_S = pkt_L.popleft()
+                self.deficit_D[flow] -= len(pkt_S)
+                if not pkt_L:
+                    self.active.popleft()
+                return pkt_S
+
+
 # wrapper class for a queue of packets
 class Interface:
+    __slots__ = ('name', 'in_queue', 'out_queue', 'mtu')
+
     ## @param maxsize - the maximum size of the queue storing packets
-    def __init__(self, name, maxsize=0):
+    # @param scheduled - use a ScheduledQueue for outgoing packets instead of a FIFO
+    # @param weight_D - {destination: weight} of the ScheduledQueue flows
+    def __init__(self, name, maxsize=0, scheduled=False, weight_D=None):
         self.name = name
         self.in_queue = queue.Queue(maxsize)
-        self.out_queue = queue.Queue(maxsize)
+        self.out_queue = ScheduledQueue(maxsize, weight_D=weight_D) if scheduled else queue.Queue(maxsize)
+        self.mtu = None #largest packet the attached link carries, set by Link
     
     ##get packet from the queue interface
     # @param in_or_out - use 'in' or 'out' interface
-    def get(self, in_or_out):
+    # @param timeout - seconds to wait for a packet, None to return at once
+    def get(self, in_or_out, timeout=None):
         try:
             if in_or_out == 'in':
-                pkt_S = self.in_queue.get(False)
+                pkt_S = self.in_queue.get(timeout is not None, timeout)
                 # if pkt_S is not None:
                 #     print('getting packet from the IN queue')
                 return pkt_S
@@ -57,39 +161,178 @@ class Interface:
     def put(self, pkt, in_or_out, block=False):
         if in_or_out == 'out':
             # print('putting packet in the OUT queue')
+            if self.mtu is not None and len(pkt) > self.mtu:
+                for frag_S in fragment(pkt, self.mtu):
+                    self.out_queue.put(frag_S, block)
+                return
             self.out_queue.put(pkt, block)
         else:
             # print('putting packet in the IN queue')
             self.in_queue.put(pkt, block)
             
         
+## Point-in-time copy of routing table rows.
+# Taking one only copies the arrays and the destination index; rendering it
+# as text, CSV or JSON can then happen on any thread without locks.
+class TableSnapshot:
+
+    ##@param name: router the table belongs to
+    # @param dest_L: column -> destination name
+    # @param dest_D: destination name -> column
+    # @param router_L: row names
+    # @param row_L: array('d') of costs per row, None for unknown routers
+    # @param order_L: destinations in reporting order, dest_L if None
+    # @param now: time the copy was taken, the wall-clock time if None
+    def __init__(self, name, dest_L, dest_D, router_L, row_L, order_L=None, now=None):
+        self.name = name
+        self.dest_L = dest_L
+        self.dest_D = dest_D
+        self.router_L = router_L
+        self.row_L = row_L
+        self.order_L = dest_L if order_L is None else order_L
+        self.time = time.time() if now is None else now
+
+    ## cost to dest through router, INF if unknown
+    def cost(self, dest, router):
+        j = self.dest_D.get(dest)
+        if j is None or router not in self.router_L:
+            return INF
+        row = self.row_L[self.router_L.index(router)]
+        if row is None:
+            return INF
+        return row[j]
+
+    ## rows of costs (None when unknown) for the given destinations
+    # @param dest_L: destinations to report, all known ones if None
+    def rows(self, dest_L=None):
+        if dest_L is None:
+            dest_L = self.order_L
+        col_L = [self.dest_D.get(dest) for dest in dest_L]
+        for router, row in zip(self.router_L, self.row_L):
+            if row is None:
+                cost_L = repeat(INF, len(dest_L))
+            elif dest_L is self.dest_L:
+                cost_L = row
+            else:
+                cost_L = [INF if j is None else row[j] for j in col_L]
+            yield router, [int(cost) if cost < INF else None for cost in cost_L]
+
+    ## the table as printed by Router.print_routes
+    def to_text(self, dest_L=None):
+        if dest_L is None:
+            dest_L = self.order_L
+        out = io.StringIO()
+        out.write('%s: routing table\n' % self.name)
+        out.write('       Cost to:\n')
+        out.write('     %s  %s\n' % (self.name, ''.join('%s  ' % dest for dest in dest_L)))
+        for index, (router, cost_L) in enumerate(self.rows(dest_L)):
+            out.write('From ' if index == 0 else '     ')
+            out.write(router + '  ')
+            out.write(''.join('-   ' if cost is None else '%d   ' % cost for cost in cost_L))
+            out.write('\n')
+        out.write('\n')
+        return out.getvalue()
+
+    ## the table as CSV, one row per router and one column per destination
+    def to_csv(self, dest_L=None):
+        if dest_L is None:
+            dest_L = self.order_L
+        line_L = [','.join([self.name] + list(dest_L))]
+        for router, cost_L in self.rows(dest_L):
+            line_L.append(','.join([router] + ['' if cost is None else str(cost) for cost in cost_L]))
+        return '\n'.join(line_L) + '\n'
+
+    ## the table as JSON: {"router", "time", "destinations", "costs": {router: [cost]}}
+    def to_json(self, dest_L=None):
+        if dest_L is None:
+            dest_L = self.order_L
+        return json.dumps({'router': self.name, 'time': self.time, 'destinations': list(dest_L),
+                           'costs': dict(self.rows(dest_L))})
+
+
+## Renders routing tables off the router threads: routers with this as their
+# reporter only queue a TableSnapshot when their routes change, and a
+# background thread writes the tables as text.
+class RouteReporter:
+
+    ##@param out: file the tables go to, sys.stdout at the time of writing if None
+    def __init__(self, out=None):
+        self.out = out
+        self.queue = queue.SimpleQueue()
+        self.count = 0  #tables written
+        self.thread = threading.Thread(name='RouteReporter', target=self.run, daemon=True)
+        self.thread.start()
+
+    ## queue a snapshot; rendering is left to the reporter thread
+    def report(self, snap):
+        self.queue.put(snap)
+
+    ## thread target writing queued tables until close() queues None
+    def run(self):
+        while True:
+            snap = self.queue.get()
+            if snap is None:
+                return
+            (sys.stdout if self.out is None else self.out).write(snap.to_text())
+            self.count += 1
+
+    ## write everything queued so far and stop the thread
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
 ## Implements a network layer packet.
 class NetworkPacket:
-    ## packet encoding lengths 
-    dst_S_length = 5
+    __slots__ = ('dst', 'prot_S', 'data_S', 'trace_L', 'ce')
+    ## packet encoding lengths; addresses are padded to dst_S_length with
+    # leading '0's, see check_address
+    dst_S_length = 8
     prot_S_length = 1
+    trace_S_length = 5
+    ## protocol field codes of data packets: plain, marked congestion
+    # experienced, traced, and traced and marked
+    data_code, data_ce_code, traced_code, traced_ce_code = '1', '5', '3', '6'
+    ## protocol field codes of the other protocols
+    code_D = {'control': '2', 'fragment': '4', 'membership': '7', 'hello': '8'}
+    prot_D = {code: prot for prot, code in code_D.items()}    # {code: protocol}
+    ## every code each protocol is sent with
+    prot_code_D = dict(code_D, data=data_code + data_ce_code + traced_code + traced_ce_code)
+    ## free list of released packets shared by all nodes
+    free_L = []
+    free_max = 1024
+    alloc_count = 0 #packets created because the free list was empty
     
     ##@param dst: address of the destination host
     # @param data_S: packet payload
     # @param prot_S: upper layer protocol for the packet (data, or control)
-    def __init__(self, dst, prot_S, data_S):
+    # @param trace_L: [(node, timestamp)] per hop, None for untraced packets
+    # @param ce: congestion experienced, set by routers with ECN marking
+    def __init__(self, dst, prot_S, data_S, trace_L=None, ce=False):
         self.dst = dst
         self.data_S = data_S
         self.prot_S = prot_S
+        self.trace_L = trace_L
+        self.ce = ce
         
     ## called when printing the object
     def __str__(self):
         return self.to_byte_S()
         
-    ## convert packet to a byte string for transmission over links
+    ## convert packet to a byte string for transmission over links;
+    # data packets use the data codes matching their ce flag and trace
     def to_byte_S(self):
         byte_S = str(self.dst).zfill(self.dst_S_length)
-        if self.prot_S == 'data':
-            byte_S += '1'
-        elif self.prot_S == 'control':
-            byte_S += '2'
+        if self.prot_S == 'data' and self.trace_L is not None:
+            trace_S = ';'.join('%s,%r' % hop for hop in self.trace_L)
+            byte_S += (self.traced_ce_code if self.ce else self.traced_code) + \
+                str(len(trace_S)).zfill(self.trace_S_length) + trace_S
+        elif self.prot_S == 'data':
+            byte_S += self.data_ce_code if self.ce else self.data_code
+        elif self.prot_S in self.code_D:
+            byte_S += self.code_D[self.prot_S]
         else:
-            raise('%s: unknown prot_S option: %s' %(self, self.prot_S))
+            raise ValueError('unknown prot_S option: %s' % self.prot_S)
         byte_S += self.data_S
         return byte_S
     
@@ -97,28 +340,435 @@ class NetworkPacket:
     # @param byte_S: byte string representation of the packet
     @classmethod
     def from_byte_S(self, byte_S):
-        dst = byte_S[0 : NetworkPacket.dst_S_length].strip('0')
+        dst = byte_S[0 : NetworkPacket.dst_S_length].lstrip('0')
         prot_S = byte_S[NetworkPacket.dst_S_length : NetworkPacket.dst_S_length + NetworkPacket.prot_S_length]
-        if prot_S == '1':
+        data_start = NetworkPacket.dst_S_length + NetworkPacket.prot_S_length
+        trace_L = None
+        ce = prot_S == self.data_ce_code or prot_S == self.traced_ce_code
+        if prot_S == self.data_code or prot_S == self.data_ce_code:
             prot_S = 'data'
-        elif prot_S == '2':
-            prot_S = 'control'
+        elif prot_S in self.prot_D:
+            prot_S = self.prot_D[prot_S]
+        elif prot_S == self.traced_code or prot_S == self.traced_ce_code:
+            prot_S = 'data'
+            trace_start = data_start + NetworkPacket.trace_S_length
+            data_start = trace_start + int(byte_S[data_start : trace_start])
+            trace_L = []
+            for hop_S in byte_S[trace_start : data_start].split(';'):
+                node, t = hop_S.rsplit(',', 1)
+                trace_L.append((node, float(t)))
         else:
-            raise('%s: unknown prot_S field: %s' %(self, prot_S))
-        data_S = byte_S[NetworkPacket.dst_S_length + NetworkPacket.prot_S_length : ]
-        return self(dst, prot_S, data_S)
+            raise ValueError('unknown prot_S field: %s' % prot_S)
+        data_S = byte_S[data_start : ]
+        p = self.alloc(dst, prot_S, data_S)
+        p.trace_L = trace_L
+        p.ce = ce
+        return p
+
+    ## take a packet from the free list, creating one only if it is empty
+    @classmethod
+    def alloc(self, dst, prot_S, data_S):
+        try:
+            p = self.free_L.pop()
+        except IndexError:
+            NetworkPacket.alloc_count += 1
+            return self(dst, prot_S, data_S)
+        p.dst = dst
+        p.prot_S = prot_S
+        p.data_S = data_S
+        p.ce = False
+        return p
+
+    ## encode a packet built from the free list, which gets the object back
+    @classmethod
+    def encode(self, dst, prot_S, data_S):
+        p = self.alloc(dst, prot_S, data_S)
+        byte_S = p.to_byte_S()
+        p.release()
+        return byte_S
+
+    ## hand the packet back to the free list; it must not be used afterwards
+    def release(self):
+        if len(self.free_L) < self.free_max:
+            self.data_S = None
+            self.trace_L = None
+            self.free_L.append(self)
     
 
     
+## Fragments: packets longer than a link's MTU are split into packets with
+# protocol 'fragment' whose data is 'ident offset more' (frag_ident_length,
+# frag_offset_length and 1 characters) followed by a piece of the original
+# packet from its protocol field on. Offsets count from the start of the
+# original packet, so fragments can be fragmented again on smaller links, and
+# more is '0' only on the piece ending the original packet.
+frag_ident_length = 8
+frag_offset_length = 6
+frag_header_length = frag_ident_length + frag_offset_length + 1
+frag_ident = itertools.count()
+## smallest MTU leaving room for a character of data behind the fragment headers
+min_mtu = NetworkPacket.dst_S_length + NetworkPacket.prot_S_length + frag_header_length + 1
+
+## protocol field codes of control packets and of fragments
+control_code_S = ''.join(NetworkPacket.code_D[prot] for prot in ['control', 'membership', 'hello'])
+fragment_code = NetworkPacket.code_D['fragment']
+
+## routing updates, group membership reports and hellos, whole or as fragments
+def is_control(pkt_S):
+    prot_S = pkt_S[NetworkPacket.dst_S_length]
+    return prot_S in control_code_S or \
+        (prot_S == fragment_code and pkt_S[:NetworkPacket.dst_S_length] == '0' * NetworkPacket.dst_S_length)
+
+## split an encoded packet into fragments of at most mtu characters
+# @return list of encoded fragments
+def fragment(pkt_S, mtu):
+    head = NetworkPacket.dst_S_length + NetworkPacket.prot_S_length
+    size = mtu - head - frag_header_length
+    if size <= 0:
+        raise ValueError('MTU %d too small for fragment headers' % mtu)
+    dst_S = pkt_S[:NetworkPacket.dst_S_length]
+    if pkt_S[NetworkPacket.dst_S_length] == fragment_code:
+        ident_S = pkt_S[head : head + frag_ident_length]
+        offset = int(pkt_S[head + frag_ident_length : head + frag_header_length - 1])
+        more_S = pkt_S[head + frag_header_length - 1]
+        body_S = pkt_S[head + frag_header_length:]
+    else:
+        ident_S = str(next(frag_ident) % 10 ** frag_ident_length).zfill(frag_ident_length)
+        offset = 0
+        more_S = '0'
+        body_S = pkt_S[NetworkPacket.dst_S_length:]
+    frag_L = []
+    for start in range(0, len(body_S), size):
+        end = start + size
+        frag_L.append('%s%s%s%s%s%s' % (dst_S, fragment_code, ident_S, str(offset + start).zfill(frag_offset_length),
+                                       '1' if end < len(body_S) else more_S, body_S[start:end]))
+    return frag_L
+
+
+## Bounded reassembly of fragmented packets.
+# At most max_packets packets are held; the oldest is dropped to make room,
+# and packets still incomplete timeout seconds after their first fragment
+# arrived are dropped.
+class Reassembler:
+
+    def __init__(self, max_packets=64, timeout=1.0):
+        self.max_packets = max_packets
+        self.timeout = timeout
+        self.buffer_D = dict()  # {(dst, ident): [first arrival, total length or None, {offset: piece}, length held]}
+        self.reassembled = 0
+        self.expired = 0    #dropped after timeout
+        self.evicted = 0    #dropped for lack of room
+
+    ## add a fragment
+    # @param p: NetworkPacket with prot_S 'fragment'
+    # @param now: arrival time, the wall-clock time if None
+    # @return the encoded original packet once all its fragments arrived, else None
+    def add(self, p, now=None):
+        if now is None:
+            now = time.time()
+        for key, entry in list(self.buffer_D.items()):
+            if now - entry[0] <= self.timeout:
+                break   #entries are in arrival order
+            del self.buffer_D[key]
+            self.expired += 1
+        ident_S = p.data_S[:frag_ident_length]
+        offset = int(p.data_S[frag_ident_length : frag_header_length - 1])
+        piece_S = p.data_S[frag_header_length:]
+        key = (p.dst, ident_S)
+        entry = self.buffer_D.get(key)
+        if entry is None:
+            if len(self.buffer_D) >= self.max_packets:
+                del self.buffer_D[next(iter(self.buffer_D))]
+                self.evicted += 1
+            entry = self.buffer_D[key] = [now, None, dict(), 0]
+        if offset not in entry[2]:
+            entry[2][offset] = piece_S
+            entry[3] += len(piece_S)
+        if p.data_S[frag_header_length - 1] == '0':
+            entry[1] = offset + len(piece_S)
+        if entry[1] is None or entry[3] < entry[1]:
+            return None
+        del self.buffer_D[key]
+        self.reassembled += 1
+        body_S = ''.join(piece_S for _, piece_S in sorted(entry[2].items()))
+        return str(p.dst).zfill(NetworkPacket.dst_S_length) + body_S
+
+
+## elementwise "value where mask else hop" over a hop array
+# @param mask: iterable of booleans, one per column
+def select(mask, value, hop):
+    return array('l', map(operator.add, hop, map(operator.mul, mask, map(operator.sub, repeat(value), hop))))
+
+
+## Dense distance-vector table.
+# Destination and router names are interned once and mapped to column and row
+# indices; every router row is an array('d') of costs (INF when unknown), so
+# the Bellman-Ford minimum over neighbors is a column-wise reduction of rows.
+class RoutingTable:
+
+    ##@param name: name of the router owning the table (always row 0)
+    # @param max_metric: costs through neighbors at or above this are INF
+    def __init__(self, name, max_metric=INF):
+        self.max_metric = max_metric
+        self.dest_L = []            # column -> destination name
+        self.dest_D = {}            # destination name -> column
+        self.sorted_L = []          # destination names in sorted order
+        self.router_L = []          # row -> router name
+        self.router_D = {}          # router name -> row
+        self.row_L = []             # row -> array('d') of costs
+        self.direct = array('d')    # cost over a direct link, per column
+        self.hop = array('l')       # row of the next hop: 0 direct, -1 none
+        self.name = sys.intern(name)
+        self.add_router(name)
+        self.set_direct(name, 0)
+
+    ## number of known destinations
+    def __len__(self):
+        return len(self.dest_L)
+
+    ## add the destinations missing from the table as new INF columns
+    # @param dest_L: iterable of destination names
+    def add_dests(self, dest_L):
+        for dest in dest_L:
+            if dest not in self.dest_D:
+                dest = sys.intern(dest)
+                self.dest_D[dest] = len(self.dest_L)
+                self.dest_L.append(dest)
+        grow = len(self.dest_L) - len(self.direct)
+        if grow == 0:
+            return
+        # the sorted index is already in order up to the new tail, which
+        # timsort merges in a single pass
+        self.sorted_L += self.dest_L[-grow:]
+        self.sorted_L.sort()
+        pad = array('d', repeat(INF, grow))
+        for row in self.row_L:
+            row.extend(pad)
+        self.direct.extend(pad)
+        self.hop.extend(array('l', repeat(-1, grow)))
+
+    ## column of a destination, added if unknown
+    def add_dest(self, dest):
+        if dest not in self.dest_D:
+            self.add_dests((dest,))
+        return self.dest_D[dest]
+
+    ## row of a router, added (all INF) if unknown
+    def add_router(self, router):
+        if router not in self.router_D:
+            router = sys.intern(router)
+            self.router_D[router] = len(self.router_L)
+            self.router_L.append(router)
+            self.row_L.append(array('d', repeat(INF, len(self.dest_L))))
+        return self.router_D[router]
+
+    ## cost to dest through router (our own best cost if router is None)
+    def cost(self, dest, router=None):
+        j = self.dest_D.get(dest)
+        r = 0 if router is None else self.router_D.get(router)
+        if j is None or r is None:
+            return INF
+        return self.row_L[r][j]
+
+    ## record the cost of a direct link to dest
+    def set_direct(self, dest, cost):
+        self.direct[self.add_dest(dest)] = cost
+
+    ## replace the distance vector advertised by a neighbor router
+    # @param router: name of the advertising neighbor
+    # @param vector_D: {destination: cost} as received in a RouterMessage
+    def set_row(self, router, vector_D):
+        self.add_dests(vector_D)
+        r = self.add_router(router)
+        self.row_L[r] = array('d', map(vector_D.get, self.dest_L, repeat(INF)))
+        return r
+
+    ## the row of neighbor r shifted by the link cost to it; costs reaching
+    # max_metric become INF
+    def shifted(self, r, link_cost):
+        cand = array('d', map(operator.add, repeat(link_cost), self.row_L[r]))
+        if self.max_metric < INF:
+            over = map(operator.and_, map(operator.ge, cand, repeat(self.max_metric)), map(operator.lt, cand, repeat(INF)))
+            for j in compress(range(len(cand)), over):
+                cand[j] = INF
+        return cand
+
+    ## candidate cost rows: direct links (row 0) and every neighbor row
+    # shifted by the link cost to that neighbor
+    def candidates(self, link_D):
+        cand_L = [(0, self.direct)]
+        for router, link_cost in link_D.items():
+            r = self.router_D.get(router)
+            if r is not None:
+                cand_L.append((r, self.shifted(r, link_cost)))
+        return cand_L
+
+    ## Bellman-Ford over whole rows: our cost to every destination is the
+    # column minimum of the candidate rows, and the next hop is the first
+    # candidate reaching that minimum.
+    # @param link_D: {neighbor router: link cost}
+    # @return list of columns whose cost or next hop changed
+    def recompute(self, link_D):
+        n = len(self.dest_L)
+        cand_L = self.candidates(link_D)
+        if len(cand_L) == 1:
+            best = array('d', self.direct)
+        else:
+            best = array('d', map(min, *[cand for _, cand in cand_L]))
+        hop = array('l', repeat(-1, n))
+        for r, cand in reversed(cand_L):
+            hop = select(map(operator.eq, cand, best), r, hop)
+        hop = select(map(operator.eq, best, repeat(INF)), -1, hop)
+        changed = compress(range(n), map(operator.or_, map(operator.ne, best, self.row_L[0]),
+                                         map(operator.ne, hop, self.hop)))
+        self.row_L[0] = best
+        self.hop = hop
+        return list(changed)
+
+    ## relax a whole incoming vector at once: the neighbor's row shifted by
+    # its link cost is compared against our current costs in one pass,
+    # producing the mask of improved destinations, which all take the
+    # neighbor as next hop.  If the neighbor got worse for a destination we
+    # currently route through it, the whole table is recomputed instead.
+    # @param router: name of the advertising neighbor
+    # @param vector_D: {destination: cost} as received in a RouterMessage
+    # @param link_D: {neighbor router: link cost}
+    # @param ties: also report columns where the neighbor joins or leaves the
+    #  set of equal-cost next hops (for multipath forwarding)
+    # @return list of columns whose cost or next hop changed
+    def relax(self, router, vector_D, link_D, ties=False):
+        link_cost = link_D.get(router, INF)
+        old = self.row_L[self.router_D[router]] if router in self.router_D else None
+        r = self.set_row(router, vector_D)
+        best = self.row_L[0]
+        cand = self.shifted(r, link_cost)
+        via_r = bytes(map(operator.eq, self.hop, repeat(r)))
+        if any(map(operator.gt, compress(cand, via_r), compress(best, via_r))):
+            changed = self.recompute(link_D)
+            return list(range(len(self.dest_L))) if ties else changed
+        changed = list(compress(range(len(best)), map(operator.lt, cand, best)))
+        if ties:
+            old_cand = repeat(INF) if old is None else map(operator.add, repeat(link_cost), old)
+            flip = map(operator.ne, map(operator.eq, old_cand, best), map(operator.eq, cand, best))
+            changed = sorted(set(changed).union(compress(range(len(best)), flip)))
+        for j in changed:
+            if cand[j] < best[j]:
+                best[j] = cand[j]
+                self.hop[j] = r
+        return changed
+
+    ## name of the neighbor to send packets for column j through, or None
+    def next_hop(self, j):
+        r = self.hop[j]
+        if r < 0 or self.dest_L[j] == self.name:
+            return None
+        if r == 0:
+            return self.dest_L[j]
+        return self.router_L[r]
+
+    ## every neighbor reaching column j at our minimum cost (equal-cost
+    # multipath), the next hop chosen by the table first
+    # @param link_D: {neighbor router: link cost}
+    def next_hops(self, j, link_D):
+        primary = self.next_hop(j)
+        if primary is None:
+            return []
+        best = self.row_L[0][j]
+        hop_L = [primary]
+        dest = self.dest_L[j]
+        if self.direct[j] == best and dest != primary:
+            hop_L.append(dest)
+        for router, link_cost in link_D.items():
+            r = self.router_D.get(router)
+            if r is not None and router != primary and link_cost + self.row_L[r][j] == best:
+                hop_L.append(router)
+        return hop_L
+
+    ## known destinations in sorted order; the index grows as advertisements
+    # name new destinations, so no global list of destinations is needed
+    def destinations(self):
+        return self.sorted_L
+
+    ## copy the rows of the given routers for reporting, see TableSnapshot
+    # @param router_L: router names, the owner first
+    # @param now: time of the copy, the wall-clock time if None
+    def snapshot(self, router_L, now=None):
+        row_L = []
+        for router in router_L:
+            r = self.router_D.get(router)
+            row_L.append(None if r is None else self.row_L[r][:])
+        return TableSnapshot(self.name, self.dest_L[:], self.dest_D.copy(), router_L, row_L,
+                             self.sorted_L[:], now)
+
+    ## our own distance vector, finite entries only
+    # @param skip_router: leave out destinations routed through this neighbor
+    #  (split horizon; the neighbor reads the omission as unreachable)
+    def vector(self, skip_router=None):
+        r = self.router_D.get(skip_router, -1)
+        if r <= 0:
+            return {dest: int(cost) for dest, cost in zip(self.dest_L, self.row_L[0]) if cost < INF}
+        return {dest: int(cost) for dest, cost, hop in zip(self.dest_L, self.row_L[0], self.hop)
+                if cost < INF and hop != r}
+
+    ## approximate memory held by the table in bytes
+    def nbytes(self):
+        size = sys.getsizeof(self) + sys.getsizeof(self.direct) + sys.getsizeof(self.hop)
+        size += sum(sys.getsizeof(row) for row in self.row_L)
+        size += sys.getsizeof(self.dest_L) + sys.getsizeof(self.dest_D)
+        size += sys.getsizeof(self.router_L) + sys.getsizeof(self.router_D)
+        size += sum(sys.getsizeof(d) for d in self.dest_L)
+        return size
+
+
+## raise ValueError for node names that do not survive the packet encoding:
+# longer than the destination field, or starting with the '0' it is padded with
+def check_address(addr):
+    addr_S = str(addr)
+    if len(addr_S) > NetworkPacket.dst_S_length or addr_S.startswith('0'):
+        raise ValueError('address %r does not fit a %d-character destination field without a leading 0' % \
+            (addr_S, NetworkPacket.dst_S_length))
+
+
+## Generated traffic payload: 'T|source|flow|seq|timestamp|' padded to size.
+traffic_tag = 'T|'
+
+## build a traffic payload carrying a sequence number and send timestamp
+# @param size: total payload length, padded with 'x'
+# @param now: send timestamp, the wall-clock time if None
+def traffic_payload(src, flow, seq, size, now=None):
+    data_S = '%s%s|%s|%d|%r|' % (traffic_tag, src, flow, seq, time.time() if now is None else now)
+    return data_S.ljust(size, 'x')
+
+## parse a traffic payload into (source, flow, seq, timestamp), None if the
+# payload was not produced by traffic_payload
+def parse_traffic_payload(data_S):
+    if not data_S.startswith(traffic_tag):
+        return None
+    field_L = data_S.split('|', 5)
+    if len(field_L) < 6:
+        return None
+    return (field_L[1], field_L[2], int(field_L[3]), float(field_L[4]))
+
 
 ## Implements a network host for receiving and transmitting data
 class Host:
     
     ##@param addr: address of this node represented as an integer
     def __init__(self, addr):
+        check_address(addr)
         self.addr = addr
         self.intf_L = [Interface("network")]
         self.stop = False #for thread termination
+        self.rx_stats_D = dict()    # {(source, flow): stats_3.FlowStats} for generated traffic
+        self.trace_stats = stats.TraceStats() #hop traces of received packets
+        self.send_hook = None #called as send_hook(host, dst, data_S) on every send, see replay_3
+        self.receive_hook = None #called as receive_hook(host, p) on every received packet, see transport_3
+        self.callback_L = [] #called as fn(host, data_S) on every received data packet, see add_callback
+        self.reassembler = Reassembler()
+        self.poll_interval = 0.05   #longest wait for a packet before checking stop
+        self.batch = 64 #max packets handled per wakeup
+        self.group_S = set()    #multicast groups joined
+        self.clock = clock.wall_clock   #source of time, see clock_3
 
     ## called when printing the object
     def __str__(self):
@@ -128,28 +778,241 @@ class Host:
     # @param dst: destination address for the packet
     # @param data_S: data being transmitted to the network layer
     def udt_send(self, dst, data_S):
-        p = NetworkPacket(dst, 'data', data_S)
+        if self.send_hook is not None:
+            self.send_hook(self, dst, data_S)
+        p = NetworkPacket.alloc(dst, 'data', data_S)
+        if trace_packets:
+            p.trace_L = [(self.addr, self.clock.time())]
         print('%s: sending packet "%s"' % (self, p))
         self.intf_L[0].put(p.to_byte_S(), 'out') #send packets always enqueued successfully
+        p.release()
         
-    ## receive packet from the network layer
-    def udt_receive(self):
-        pkt_S = self.intf_L[0].get('in')
-        if pkt_S is not None:
-            print('%s: received packet "%s"' % (self, pkt_S))
+    ## join a multicast group; the membership report goes to our router
+    def join(self, group):
+        self.group_S.add(group)
+        self.intf_L[0].put(NetworkPacket.encode(0, 'membership', 'J|%s' % group), 'out')
+
+    def leave(self, group):
+        self.group_S.discard(group)
+        self.intf_L[0].put(NetworkPacket.encode(0, 'membership', 'L|%s' % group), 'out')
+
+    ## call fn(host, data_S) with the payload of every received data packet
+    def add_callback(self, fn):
+        self.callback_L = self.callback_L + [fn]
+
+    def remove_callback(self, fn):
+        self.callback_L = [cb for cb in self.callback_L if cb != fn]
+
+    ## receive packets from the network layer
+    # @param timeout: seconds to wait for a packet, None to only take one
+    #  that is already queued
+    # @param batch: max packets taken once one has arrived
+    # @return number of packets taken from the interface
+    def udt_receive(self, timeout=None, batch=1):
+        pkt_S = self.intf_L[0].get('in', timeout)
+        count = 0
+        while pkt_S is not None:
+            self.deliver(pkt_S)
+            count += 1
+            if count >= batch:
+                break
+            pkt_S = self.intf_L[0].get('in')
+        return count
+
+    ## handle one packet taken from the interface
+    def deliver(self, pkt_S):
+        print('%s: received packet "%s"' % (self, pkt_S))
+        p = NetworkPacket.from_byte_S(pkt_S)
+        if p.prot_S == 'fragment':
+            pkt_S = self.reassembler.add(p, self.clock.time())
+            p.release()
+            if pkt_S is None:
+                return
+            p = NetworkPacket.from_byte_S(pkt_S)
+        if is_group(p.dst) and p.dst not in self.group_S:
+            p.release()
+            return
+        if p.trace_L is not None:
+            p.trace_L.append((self.addr, self.clock.time()))
+            self.trace_stats.record(p.trace_L)
+        traffic = parse_traffic_payload(p.data_S)
+        if traffic is not None:
+            src, flow, seq, sent = traffic
+            if (src, flow) not in self.rx_stats_D:
+                self.rx_stats_D[(src, flow)] = stats.FlowStats()
+            self.rx_stats_D[(src, flow)].record(seq, self.clock.time() - sent)
+        if self.receive_hook is not None:
+            self.receive_hook(self, p)
+        for fn in self.callback_L:
+            fn(self, p.data_S)
+        p.release()
+
+    ## print latency, path and per-hop delay statistics of traced packets
+    def print_trace_stats(self):
+        self.trace_stats.print_stats(self)
+
+    ## print receive statistics of generated traffic per (source, flow)
+    # @param sent_D: {(source, flow): packets sent to us}, see
+    #  traffic_3.sent_to, which also lists flows that delivered nothing;
+    #  without it only gaps in the sequence count as lost
+    def print_rx_stats(self, sent_D=None):
+        if sent_D is None:
+            for (src, flow), flow_stats in sorted(self.rx_stats_D.items()):
+                print('%s: from %s flow %s: %s' % (self, src, flow, flow_stats.summary()))
+            return
+        for src, flow in sorted(set(self.rx_stats_D) | set(sent_D)):
+            flow_stats = self.rx_stats_D.get((src, flow), stats.FlowStats())
+            print('%s: from %s flow %s: %s' % (self, src, flow, flow_stats.summary(sent_D.get((src, flow), 0))))
+       
+    ## read the time from clock, see clock_3
+    def set_clock(self, clock):
+        self.clock = clock
+
+    ## handle the packets already queued, for stepping by a
+    # clock_3.VirtualClock
+    # @return number of packets handled
+    def step(self):
+        return self.udt_receive(None, self.batch)
+
+    ## hosts keep no timers
+    def next_timer(self):
+        return None
        
-    ## thread target for the host to keep receiving data
+    ## thread target for the host to keep receiving data; waits on the
+    # interface instead of polling it
     def run(self):
         print (threading.currentThread().getName() + ': Starting')
         while True:
             #receive data arriving to the in interface
-            self.udt_receive()
+            self.udt_receive(self.poll_interval, self.batch)
             #terminate
             if(self.stop):
                 print (threading.currentThread().getName() + ': Ending')
                 return
 
-all_destinations = ['H1', 'H2', 'H3',  'RA', 'RB','RC', 'RD']
+## Multicast.
+# Destinations starting with group_prefix are groups. Hosts join a group by
+# sending a membership report 'J|group' ('L|group' to leave) to their
+# router, protocol 'membership'. Every group has a shared, bidirectional distribution
+# tree rooted at a rendezvous router, picked by hashing the group over the
+# routers it has routes to so all converged routers agree. Joins travel
+# hop by hop toward the rendezvous router along the unicast routes (reverse
+# path), and each router on the way records the port the join came from. A
+# router forwards group packets to every tree port except the one they came
+# in on, so a packet crosses each tree link once however many members sit
+# behind it; routers off the tree pass packets on toward the rendezvous
+# router. While routes are still being learned the rendezvous router can
+# move, so whenever routes change a router on a tree whose way to the
+# rendezvous router moved joins through the new port and leaves through the
+# old one; joins arriving before any route exists wait at the first router.
+group_prefix = 'G'
+
+def is_group(dst):
+    return dst.startswith(group_prefix)
+
+
+## Delivers the payloads received by a host to a consumer, either by
+# iterating over it or in batches; payloads arriving while maxsize are
+# waiting are dropped and counted.
+class Receiver:
+
+    closed = object()   #queued by close() to wake a waiting consumer
+
+    ##@param host: Host whose data packets are consumed
+    # @param maxsize: payloads buffered for the consumer, 0 for unlimited
+    def __init__(self, host, maxsize=0):
+        self.host = host
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.closing = False    #set by close(), the queue only drains from then on
+        self.done = False
+        host.add_callback(self.put)
+
+    ## Host callback
+    def put(self, host, data_S):
+        try:
+            self.queue.put_nowait(data_S)
+        except queue.Full:
+            self.dropped += 1
+
+    ## wait for payloads
+    # @param max_count: max payloads returned
+    # @param timeout: seconds to wait for the first payload, None to wait
+    #  until one arrives or the receiver is closed
+    # @return list of payloads, empty on timeout or once closed
+    def get_batch(self, max_count=64, timeout=None):
+        if self.done or (self.closing and self.queue.empty()):
+            self.done = True
+            return []
+        try:
+            data_L = [self.queue.get(True, timeout)]
+        except queue.Empty:
+            return []
+        while len(data_L) < max_count and data_L[-1] is not self.closed:
+            try:
+                data_L.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if data_L[-1] is self.closed:
+            data_L.pop()
+            self.done = True
+        elif self.closing and self.queue.empty():
+            self.done = True
+        return data_L
+
+    ## payloads one at a time until the receiver is closed
+    def __iter__(self):
+        while True:
+            data_L = self.get_batch()
+            if not data_L and self.done:
+                return
+            yield from data_L
+
+    ## stop receiving; iteration ends after the payloads already queued
+    def close(self):
+        self.host.remove_callback(self.put)
+        self.closing = True
+        try:
+            self.queue.put_nowait(self.closed)
+        except queue.Full:
+            pass    #the consumer is not waiting and sees closing once it drained the queue
+
+
+## Routing areas.
+# Node names of the form 'area.name' (e.g. '3.R12', '3.H12') place the node in
+# an area; names without a '.' belong to no area. Like every address they must
+# pass check_address, so areas are numbered from 1. Routers running with areas
+# advertise the destinations of a neighbor's own area individually and every
+# other area as a single summary destination '@area' at its lowest cost, so
+# interior routers only hold intra-area routes plus one entry per other area.
+# Routers with neighbors in another area are the border routers between them.
+summary_prefix = '@'
+
+## area of a node or summary name, None if it is in no area
+def area_of(name):
+    if name.startswith(summary_prefix):
+        return name[len(summary_prefix):]
+    area, dot, _ = name.partition('.')
+    return area if dot else None
+
+## summary destination standing for all destinations of an area
+def area_summary(area):
+    return summary_prefix + area
+
+## the part of a distance vector advertised to a neighbor in area
+# @param vector_D: {destination: cost}
+def summarize(vector_D, area):
+    out_D = {}
+    for dest, cost in vector_D.items():
+        dest_area = area_of(dest)
+        if dest_area is None or (dest_area == area and not dest.startswith(summary_prefix)):
+            out_D[dest] = cost
+        elif dest_area != area:
+            summary = area_summary(dest_area)
+            if cost < out_D.get(summary, INF):
+                out_D[summary] = cost
+    return out_D
+
 
 ## Implements a multi-interface router
 class Router:
@@ -158,28 +1021,86 @@ class Router:
     ##@param name: friendly router name for debugging
     # @param cost_D: cost table to neighbors {neighbor: {interface: cost}}
     # @param max_queue_size: max queue length (passed to Interface)
-    def __init__(self, name, cost_D, max_queue_size):
+    # @param ecmp: spread flows over all equal-cost next hops
+    # @param scheduled: prioritize control packets and share interfaces fairly
+    #  among data flows (see ScheduledQueue)
+    # @param areas: summarize the destinations of other areas (see area_of)
+    # @param ecn_threshold: mark data packets congestion experienced when the
+    #  output queue holds this many packets, None to never mark
+    # @param cut_through: forward plain data packets without parsing them
+    # @param hello_interval: seconds between hellos to every neighbor router,
+    #  None to assume links never fail. A neighbor not heard from for
+    #  dead_interval (4 hello intervals by default) is declared dead and its
+    #  link cost set to INF until its hellos return; routes are then
+    #  advertised with split horizon so withdrawals do not loop between
+    #  neighbors.
+    # @param max_metric: route costs reaching this count as unreachable (RIP
+    #  uses 16). Split horizon cannot stop a withdrawal looping through three
+    #  or more routers, so with hellos this must be finite: set it just above
+    #  the largest real route cost, or leave it None for max_metric_hops
+    #  times the largest link cost. Without hellos None means no limit.
+    # @param weight_D: with scheduled, {destination: weight} giving data flows
+    #  to some destinations a larger share of every interface, 1 by default
+    def __init__(self, name, cost_D, max_queue_size, ecmp=False, scheduled=False, areas=False, ecn_threshold=None,
+                 cut_through=True, hello_interval=None, dead_interval=None, max_metric=None, weight_D=None):
+        check_address(name)
+        if hello_interval is not None:
+            if hello_interval <= 0:
+                raise ValueError('hello_interval must be positive, not %r' % hello_interval)
+            if dead_interval is not None and dead_interval <= hello_interval:
+                raise ValueError('dead_interval %r must be longer than hello_interval %r' % (dead_interval, hello_interval))
+            if max_metric == INF:
+                raise ValueError('routes withdrawn by hellos need a finite max_metric to stop counting to infinity')
+            if max_metric is None:
+                max_metric = max_metric_hops * max([cost for intf_D in cost_D.values() for cost in intf_D.values()], default=1)
+        elif max_metric is None:
+            max_metric = INF
         self.stop = False #for thread termination
         self.name = name
+        self.areas = areas
+        self.ecn_threshold = ecn_threshold
+        self.marked = 0 #data packets marked congestion experienced
+        self.dropped = 0    #packets lost to full output queues or missing routes
+        self.cut_through = cut_through
+        self.hello_interval = hello_interval
+        self.dead_interval = dead_interval if dead_interval is not None or hello_interval is None else 4 * hello_interval
+        self.next_hello_t = 0.0
+        self.hello_D = dict()   # {neighbor router: when we last heard from it}
+        self.dead_S = set()     #neighbor routers declared dead
+        self.group_D = dict()       # {group: set of ports with members behind them}
+        self.upstream_D = dict()    # {group: port toward the rendezvous router, None at it}, cleared when routes change
+        self.joined_D = dict()      # {group: port our join was passed on through}
         #create a list of interfaces
         # self.intf_L = [Interface(max_queue_size) for _ in range(len(cost_D))]
         self.neb_routers = [self.Intf_data(self.name,None)]
         self.intf_L = dict()
         self.fastest_D = dict()
+        self.ecmp = ecmp
+        self.ecmp_D = dict()    # {destination: [port]} where several ports tie
+        self.route_lock = threading.Lock()  #guards rt_tbl, fastest_D and ecmp_D
+        self.clock = clock.wall_clock   #source of time, see clock_3
+        self.block = True   #wait for room in full output queues; a stepped clock drops instead
+        self.last_change_t = self.clock.time()    #when our routes last changed
+        self.profiler = None    #per-phase timing, see profile_3.PhaseProfiler
+        self.reporter = None    #RouteReporter printing our table on route changes, None to print only on demand
+        self.reassembler = Reassembler()    #for fragmented routing updates
         self.cost_D = cost_D    # {neighbor: {interface: cost}}
         
         print("costs: ",cost_D)
-        self.rt_tbl_D = {}      # {destination: {router: cost}}
+        self.rt_tbl = RoutingTable(self.name, max_metric)   # dense {destination x router: cost}
+        self.port_D = dict()    # {neighbor: port}
+        self.link_D = dict()    # {neighbor router: link cost}
         for dest, interfaces in cost_D.items():
             assert(len(interfaces.keys()) == 1)
             for port, cost in interfaces.items():
-                self.intf_L[port] = Interface(dest, max_queue_size)
-                self.rt_tbl_D.update({dest:{self.name:cost}})
-                self.fastest_D.update({dest:port})
+                self.intf_L[port] = Interface(dest, max_queue_size, scheduled, weight_D)
+                self.rt_tbl.set_direct(dest, cost)
+                self.port_D[dest] = port
             if 'R' in dest:
                 self.neb_routers.append(self.Intf_data(dest, port))
-        # cost to self is always zero:
-        self.rt_tbl_D.update({self.name:{self.name:0}})
+                self.link_D[dest] = cost
+        self.update_fastest(self.rt_tbl.recompute(self.link_D))
+        self.hello_D = dict.fromkeys(self.link_D, self.clock.time())
         self.neb_routers.sort(key=operator.itemgetter(0))
         print("neb_routers ", self.neb_routers)
         print(self.name, "interfaces: ")
@@ -199,37 +1120,203 @@ class Router:
     ## look through the content of incoming interfaces and
     # process data and control packets
     def process_queues(self):
+        prof = self.profiler
+        processed = 0
         for i, interface in self.intf_L.items():
             pkt_S = None
             #get packet from interface i
+            if prof is not None:
+                t = time.perf_counter()
             pkt_S = self.intf_L[i].get('in')
+            if prof is not None:
+                t = prof.lap('dequeue', t)
             #if packet exists make a forwarding decision
             if pkt_S is not None:
+                processed += 1
+                if self.cut_through and self.forward_raw(pkt_S, i):
+                    continue
                 p = NetworkPacket.from_byte_S(pkt_S) #parse a packet out
-                if p.prot_S == 'data':
+                if prof is not None:
+                    t = prof.lap('parse', t)
+                if p.prot_S == 'fragment' and p.dst in ('', self.name):
+                    #fragment of a routing update for us
+                    pkt_S = self.reassembler.add(p, self.clock.time())
+                    p.release()
+                    if pkt_S is None:
+                        continue
+                    p = NetworkPacket.from_byte_S(pkt_S)
+                if is_group(p.dst) and p.prot_S in ('data', 'fragment'):
+                    self.forward_group(p, i)
+                elif p.prot_S in ('data', 'fragment'):
                     self.forward_packet(p,i)
+                elif p.prot_S == 'membership':
+                    self.update_membership(p, i)
+                elif p.prot_S == 'hello':
+                    self.hello_received(self.intf_L[i].name)
                 elif p.prot_S == 'control':
                     mssg = RouterMessage.from_byte_S(p.data_S)
                     self.update_routes(mssg, self.intf_L[i].name)
+                    if prof is not None:
+                        prof.lap('control', t)
                 else:
                     raise Exception('%s: Unknown packet type in packet %s' % (self, p))
+                p.release()
+        return processed
             
 
     ## forward the packet according to the routing table
     #  @param p Packet to forward
     #  @param i Incoming interface number for packet p
     def forward_packet(self, p, i):
+        prof = self.profiler
+        if prof is not None:
+            t = time.perf_counter()
         try:
             # TODO: Here you will need to implement a lookup into the 
             # forwarding table to find the appropriate outgoing interface
             # for now we assume the outgoing interface is 1
-            forward_port = self.fastest_D[p.dst]
-            self.intf_L[forward_port].put(p.to_byte_S(), 'out', True)
+            forward_port = self.lookup(p.dst)
+            if p.dst in self.ecmp_D:
+                forward_port = self.flow_port(p, i)
+            if p.trace_L is not None:
+                p.trace_L.append((self.name, self.clock.time()))
+            if self.ecn_threshold is not None and p.prot_S == 'data' and \
+                    self.intf_L[forward_port].out_queue.qsize() >= self.ecn_threshold:
+                if not p.ce:
+                    p.ce = True
+                    self.marked += 1
+            if prof is not None:
+                t = prof.lap('lookup', t)
+            pkt_S = p.to_byte_S()
+            self.intf_L[forward_port].put(pkt_S, 'out', self.block)
+            if prof is not None:
+                t = prof.lap('enqueue', t)
             print('%s: forwarding packet "%s" from interface %d to %d' % \
-                (self, p, i, forward_port))
+                (self, pkt_S, i, forward_port))
+            if prof is not None:
+                prof.lap('print', t)
         except queue.Full:
+            self.dropped += 1
             print('%s: packet "%s" lost on interface %d' % (self, p, i))
             pass
+        except KeyError:
+            #no route, e.g. withdrawn after a neighbor died
+            self.dropped += 1
+            print('%s: packet "%s" lost on interface %d: no route to %s' % (self, p, i, p.dst))
+
+
+    ## fast path: forward a plain data packet as received, looking only at its
+    # destination field; the prot field is rewritten in place to mark it
+    #  @param pkt_S Encoded packet
+    #  @param i Incoming interface number for the packet
+    #  @return False if the packet needs the full parse and forward_packet
+    def forward_raw(self, pkt_S, i):
+        dst_length = NetworkPacket.dst_S_length
+        prot_S = pkt_S[dst_length]
+        data_code = NetworkPacket.data_code
+        if prot_S != data_code and prot_S != NetworkPacket.data_ce_code:
+            return False    #control, traced, fragments, membership
+        dst = pkt_S[:dst_length].lstrip('0')
+        if dst in self.ecmp_D or is_group(dst):
+            return False
+        prof = self.profiler
+        if prof is not None:
+            t = time.perf_counter()
+        try:
+            forward_port = self.lookup(dst)
+            intf = self.intf_L[forward_port]
+        except KeyError:
+            return False
+        if prot_S == data_code and self.ecn_threshold is not None and intf.out_queue.qsize() >= self.ecn_threshold:
+            pkt_S = pkt_S[:dst_length] + NetworkPacket.data_ce_code + pkt_S[dst_length + 1:]
+            self.marked += 1
+        if prof is not None:
+            t = prof.lap('lookup', t)
+        try:
+            intf.put(pkt_S, 'out', self.block)
+            if prof is not None:
+                t = prof.lap('enqueue', t)
+            print('%s: forwarding packet "%s" from interface %d to %d' % \
+                (self, pkt_S, i, forward_port))
+            if prof is not None:
+                prof.lap('print', t)
+        except queue.Full:
+            self.dropped += 1
+            print('%s: packet "%s" lost on interface %d' % (self, pkt_S, i))
+        return True
+
+    ## rendezvous router rooting the distribution tree of a group, among the
+    # routers we have a route to
+    def rendezvous(self, group):
+        router_L = [dest for dest in self.rt_tbl.destinations()
+                    if 'R' in dest and (dest == self.name or dest in self.fastest_D)]
+        return router_L[zlib.crc32(group.encode()) % len(router_L)]
+
+    ## port toward the rendezvous router of a group, None if we are it
+    def upstream(self, group):
+        if group not in self.upstream_D:
+            rp = self.rendezvous(group)
+            self.upstream_D[group] = None if rp == self.name else self.fastest_D[rp]
+        return self.upstream_D[group]
+
+    ## handle a join or leave from interface i; the first join and the last
+    # leave are passed on toward the rendezvous router
+    def update_membership(self, p, i):
+        kind, group = p.data_S.split('|', 1)
+        port_S = self.group_D.setdefault(group, set())
+        if kind == 'L':
+            port_S.discard(i)
+        elif i != self.upstream(group):
+            port_S.add(i)
+        if not port_S:
+            del self.group_D[group]
+        self.pass_membership(group)
+
+    ## join a group through the port toward its rendezvous router while we
+    # are on its tree, and leave through the port we joined through once we
+    # are off the tree or that port is no longer the way to the rendezvous
+    # router
+    def pass_membership(self, group):
+        joined = self.joined_D.get(group)
+        upstream = self.upstream(group) if group in self.group_D else None
+        if joined == upstream:
+            return
+        if joined is not None:
+            del self.joined_D[group]
+            self.send_membership('L|' + group, joined)
+        if upstream is not None:
+            self.joined_D[group] = upstream
+            self.send_membership('J|' + group, upstream)
+
+    def send_membership(self, data_S, i):
+        print('%s: passing %s of group %s to interface %d' % (self, 'join' if data_S[0] == 'J' else 'leave', data_S[2:], i))
+        try:
+            self.intf_L[i].put(NetworkPacket.encode(0, 'membership', data_S), 'out', self.block)
+        except queue.Full:
+            self.dropped += 1
+
+    ## replicate a group packet onto every tree port but the incoming one;
+    # off the tree it only moves on toward the rendezvous router
+    #  @param i Incoming interface number for packet p
+    def forward_group(self, p, i):
+        try:
+            upstream = self.upstream(p.dst)
+        except KeyError:
+            self.dropped += 1
+            print('%s: group packet "%s" lost on interface %d: no route to its rendezvous router' % (self, p, i))
+            return
+        port_S = set(self.group_D.get(p.dst, ()))
+        if upstream is not None:
+            port_S.add(upstream)
+        port_S.discard(i)
+        pkt_S = p.to_byte_S()
+        for port in sorted(port_S):
+            try:
+                self.intf_L[port].put(pkt_S, 'out', self.block)
+                print('%s: forwarding group packet "%s" from interface %d to %d' % (self, pkt_S, i, port))
+            except queue.Full:
+                self.dropped += 1
+                print('%s: group packet "%s" lost on interface %d' % (self, pkt_S, port))
 
 
     ## send out route update
@@ -237,93 +1324,185 @@ class Router:
     def send_routes(self, i):
         # TODO: Send out a routing table update
         #create a routing table update packet
-        p = NetworkPacket(0, 'control',  RouterMessage(self.name, self.build_update_tbl() ).to_byte_S())
+        p = NetworkPacket.alloc(0, 'control',  RouterMessage(self.name, self.build_update_tbl(self.intf_L[i].name) ).to_byte_S())
         try:
             #TODO: add logic to send out a route update
             print('%s: sending routing update "%s" from interface %d' % (self, p, i))
-            self.intf_L[i].put(p.to_byte_S(), 'out', True)
+            self.intf_L[i].put(p.to_byte_S(), 'out', self.block)
         except queue.Full:
             print('%s: packet "%s" lost on interface %d' % (self, p, i))
             pass
+        p.release()
 
-    def build_update_tbl(self):
-        tbl = dict()
-        for dest, routers in self.rt_tbl_D.items():
-            tbl[dest] = routers[self.name]
-        return tbl
+    ## our distance vector as advertised to a neighbor
+    # @param neighbor: name of the neighbor, only needed with areas or hellos
+    def build_update_tbl(self, neighbor=None):
+        vector_D = self.rt_tbl.vector(neighbor if self.hello_interval is not None else None)
+        if self.areas and neighbor is not None:
+            return summarize(vector_D, area_of(neighbor))
+        return vector_D
+
+    ## output port for dst; with areas, destinations in other areas are
+    # reached through their area summary
+    def lookup(self, dst):
+        if self.areas and dst not in self.fastest_D:
+            area = area_of(dst)
+            if area is not None:
+                return self.fastest_D[area_summary(area)]
+        return self.fastest_D[dst]
+
+    ## refresh the forwarding table for the given routing table columns
+    # @param changed: column indices returned by RoutingTable.recompute
+    def update_fastest(self, changed):
+        if changed:
+            self.upstream_D.clear()
+        for j in changed:
+            dest = self.rt_tbl.dest_L[j]
+            neighbor = self.rt_tbl.next_hop(j)
+            if neighbor is None:
+                self.fastest_D.pop(dest, None)
+            else:
+                self.fastest_D[dest] = self.port_D[neighbor]
+            if self.ecmp:
+                hop_L = self.rt_tbl.next_hops(j, self.link_D)
+                if len(hop_L) > 1:
+                    self.ecmp_D[dest] = [self.port_D[hop] for hop in hop_L]
+                else:
+                    self.ecmp_D.pop(dest, None)
+
+    ## pick one of the equal-cost ports for p by hashing (source, destination,
+    # flow id); packets carry no source address, so the source and flow are
+    # taken from generated traffic payloads or hop traces, falling back to the
+    # incoming interface
+    #  @param i Incoming interface number for packet p
+    def flow_port(self, p, i):
+        port_L = self.ecmp_D[p.dst]
+        traffic = parse_traffic_payload(p.data_S)
+        if traffic is not None:
+            key_S = '%s|%s|%s' % (traffic[0], p.dst, traffic[1])
+        elif p.trace_L is not None:
+            key_S = '%s|%s|' % (p.trace_L[0][0], p.dst)
+        else:
+            key_S = '%d|%s|' % (i, p.dst)
+        # crc32 alone barely mixes its low bits; take the high bits of a
+        # Fibonacci hash of it instead
+        h = (zlib.crc32(key_S.encode()) * 0x9E3779B1) & 0xffffffff
+        return port_L[(h >> 16) % len(port_L)]
 
 
     #  @param p Packet containing routing information
     def update_routes(self, p, intf_name):
         print('%s: Received routing update %s from interface %s' % (self, p, intf_name))
         print("updates: ",p.table)
-        # update the table for the ports you just recieved:
-        for host, cost in p.table.items():
-            if host in self.rt_tbl_D.keys():
-                self.rt_tbl_D[host][intf_name] = cost
-            else:
-                self.rt_tbl_D[host] = dict()
-                self.rt_tbl_D[host][intf_name] = cost
-        change = False
-        # check to see if anything in your table changes:
-        for dest, cost in p.table.items():
-            new_cost = self.rt_tbl_D[intf_name][self.name] + cost
-            if self.name in self.rt_tbl_D[dest].keys():
-                old_cost = self.rt_tbl_D[dest][self.name]
-            else:
-                old_cost = float("inf")
-            # print("dest: ", dest,"new cost: ",new_cost,"old_cost: ", old_cost)
-            if new_cost < old_cost:
-                self.rt_tbl_D[dest][self.name] = new_cost
-                for port, intf in self.intf_L.items():
-                    if intf.name == intf_name:
-                        self.fastest_D[dest] = port
-                        break
-                # print("\n\n\nNew fastest port to %s: %d using router %s\n\n\n" % (dest, self.fastest_D[dest], intf_name))
-                change = True
+        # relax the neighbor's whole vector against our current costs:
+        with self.route_lock:
+            changed = self.rt_tbl.relax(intf_name, p.table, self.link_D, self.ecmp)
+            self.update_fastest(changed)
+        self.routes_changed(changed)
+
+    ## change the cost of the link to a neighbor and advertise the new routes
+    def set_link_cost(self, neighbor, cost):
+        with self.route_lock:
+            self.rt_tbl.set_direct(neighbor, cost)
+            if neighbor in self.link_D:
+                self.link_D[neighbor] = cost
+            changed = self.rt_tbl.recompute(self.link_D)
+            if self.ecmp:
+                changed = range(len(self.rt_tbl))
+            self.update_fastest(changed)
+        self.routes_changed(changed)
+
+    ## send hellos when due and declare neighbors dead whose hellos stopped
+    # @return number of hellos sent
+    def keepalive(self):
+        now = self.clock.time()
+        sent = 0
+        if now >= self.next_hello_t:
+            self.next_hello_t = now + self.hello_interval
+            hello_S = NetworkPacket.encode(0, 'hello', self.name)
+            for neighbor in self.link_D:
+                try:
+                    self.intf_L[self.port_D[neighbor]].put(hello_S, 'out')
+                    sent += 1
+                except queue.Full:
+                    pass    #a full queue will not carry data either
+        for neighbor, heard_t in self.hello_D.items():
+            if neighbor not in self.dead_S and now >= heard_t + self.dead_interval:  #as in next_timer, or rounding can keep the timer due forever
+                print('%s: neighbor %s is dead' % (self, neighbor))
+                self.dead_S.add(neighbor)
+                self.set_link_cost(neighbor, INF)
+        return sent
+
+    ## a hello arrived from a neighbor router; revive it if it was dead
+    def hello_received(self, neighbor):
+        self.hello_D[neighbor] = self.clock.time()
+        if neighbor in self.dead_S:
+            print('%s: neighbor %s is back' % (self, neighbor))
+            self.dead_S.discard(neighbor)
+            self.set_link_cost(neighbor, next(iter(self.cost_D[neighbor].values())))
+
+    ## report and send out our routes to all neighbor routers if any changed
+    # @param changed: routing table columns that changed
+    def routes_changed(self, changed):
+        change = len(changed) > 0
         if change:
-            self.print_routes()
+            self.last_change_t = self.clock.time()
+            if self.reporter is not None:
+                self.reporter.report(self.routes_snapshot())
             for neghbor_data in self.neb_routers:
                 if neghbor_data.name != self.name:
                     self.send_routes(neghbor_data.port)
+            for group in set(self.group_D) | set(self.joined_D):
+                self.pass_membership(group)
+
 
+    ## copy of the routing table rows for this router and its neighbor routers
+    def routes_snapshot(self):
+        with self.route_lock:
+            return self.rt_tbl.snapshot([router.name for router in self.neb_routers], self.clock.time())
 
-    ## Print routing table
-    print_lock = threading.Lock()
+    ## Print routing table over the destinations this router has learned of;
+    # the table is copied under route_lock and rendered without holding any lock
     def print_routes(self):
-        self.print_lock.acquire()
-        print('%s: routing table' % self)
-        #print(self.rt_tbl_D)
-        print("       Cost to:")
-        print("    ",self.name," ", end='')
-        for dest in all_destinations:
-            print(dest," ",end='')
-        print()
-        for index, router in enumerate(self.neb_routers):
-            if index == 0:
-                print("From ", end='')
-            else:
-                print("     ", end='')
-            print(router.name + "  ", end='')
-            for dest in all_destinations:
-                if dest in self.rt_tbl_D.keys():
-                    if router.name in self.rt_tbl_D[dest].keys():
-                        print(str(self.rt_tbl_D[dest][router.name]) + "   ",end='')
-                    else:
-                        print("-   ", end='')
-                else:
-                    print("-   ", end='')
-            print()
-        print()
-        self.print_lock.release()
+        sys.stdout.write(self.routes_snapshot().to_text())
 
 
 
+    ## read the time from clock, see clock_3; the hello and dead timers
+    # restart on the new clock
+    def set_clock(self, clock):
+        self.clock = clock
+        self.block = not clock.stepped  #nothing would ever make room
+        now = clock.time()
+        self.last_change_t = now
+        self.next_hello_t = now
+        self.hello_D = dict.fromkeys(self.hello_D, now)
+
+    ## one pass of the thread loop, also used to step the router by a
+    # clock_3.VirtualClock
+    # @return number of packets processed or sent
+    def step(self):
+        processed = self.process_queues()
+        if self.profiler is not None:
+            self.profiler.iteration(processed)
+        if self.hello_interval is not None:
+            processed += self.keepalive()
+        return processed
+
+    ## earliest time a hello is due or a neighbor would be declared dead,
+    # None without hellos
+    def next_timer(self):
+        if self.hello_interval is None:
+            return None
+        t_L = [heard_t + self.dead_interval for neighbor, heard_t in self.hello_D.items() if neighbor not in self.dead_S]
+        return min(t_L + [self.next_hello_t])
+
     ## thread target for the host to keep forwarding data
     def run(self):
         print (threading.currentThread().getName() + ': Starting')
+        self.hello_D = dict.fromkeys(self.hello_D, self.clock.time())  #dead timers start with the thread
         while True:
-            self.process_queues()
+            self.step()
             if self.stop:
                 print (threading.currentThread().getName() + ': Ending')
                 return
@@ -0,0 +1,107 @@
+import os
+import sys
+import threading
+import time
+
+## Opt-in instrumentation for the Router and LinkLayer loops.
+# attach() gives nodes a PhaseProfiler, which their loops use to time each
+# phase and count productive versus idle iterations. StackSampler samples
+# thread stacks and writes them in the folded format read by flamegraph.pl
+# and speedscope.
+
+
+## Per-phase timing and loop iteration counts of one node
+class PhaseProfiler:
+
+    def __init__(self, name):
+        self.name = name
+        self.time_D = dict()    # {phase: seconds}
+        self.count_D = dict()   # {phase: times entered}
+        self.busy = 0   #loop iterations that moved or processed packets
+        self.idle = 0   #loop iterations that found nothing to do
+        self.packets = 0
+
+    ## charge the time since t to phase
+    # @return the current time, to start the next phase from
+    def lap(self, phase, t):
+        now = time.perf_counter()
+        self.time_D[phase] = self.time_D.get(phase, 0.0) + now - t
+        self.count_D[phase] = self.count_D.get(phase, 0) + 1
+        return now
+
+    ## count one loop iteration
+    # @param packets: packets handled in that iteration
+    def iteration(self, packets):
+        if packets:
+            self.busy += 1
+            self.packets += packets
+        else:
+            self.idle += 1
+
+    def print_report(self):
+        total = sum(self.time_D.values())
+        print('%s: %d busy / %d idle iterations, %d packets' % (self.name, self.busy, self.idle, self.packets))
+        for phase, seconds in sorted(self.time_D.items(), key=lambda item: -item[1]):
+            print('%s:     %-8s %8.3f s %5.1f%% %10d calls %8.2f us/call' % \
+                (self.name, phase, seconds, 100 * seconds / total if total else 0,
+                 self.count_D[phase], seconds / self.count_D[phase] * 1e6))
+
+
+## give every node (Router or LinkLayer) its own PhaseProfiler
+# @return list of the profilers
+def attach(node_L):
+    for node in node_L:
+        node.profiler = PhaseProfiler(str(node))
+    return [node.profiler for node in node_L]
+
+## remove the profilers again
+def detach(node_L):
+    for node in node_L:
+        node.profiler = None
+
+
+## Samples the stacks of all other threads at a fixed interval
+class StackSampler:
+
+    ##@param interval: seconds between samples
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stack_D = dict()   # {folded stack: samples}
+        self.samples = 0
+        self.stop = False #for thread termination
+
+    ## called when printing the object
+    def __str__(self):
+        return 'StackSampler'
+
+    ## fold a frame into 'thread;file:function;...' from the outermost call
+    def fold(self, thread_name, frame):
+        frame_L = []
+        while frame is not None:
+            code = frame.f_code
+            frame_L.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        frame_L.append(thread_name)
+        return ';'.join(reversed(frame_L))
+
+    ## take one sample of every thread except this one
+    def sample(self):
+        name_D = {t.ident: t.name for t in threading.enumerate()}
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident != me:
+                stack_S = self.fold(name_D.get(ident, str(ident)), frame)
+                self.stack_D[stack_S] = self.stack_D.get(stack_S, 0) + 1
+        self.samples += 1
+
+    ## thread target sampling until stop is set
+    def run(self):
+        while not self.stop:
+            self.sample()
+            time.sleep(self.interval)
+
+    ## write the samples in folded-stack format, one 'stack count' per line
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack_S, count in sorted(self.stack_D.items()):
+                f.write('%s %d\n' % (stack_S, count))
@@ -0,0 +1,140 @@
+import network_3 as network
+import csv
+import threading
+
+## Host send traces: CSV rows of (time, source host, destination, payload),
+# written by TraceRecorder and streamed back by TraceReplayer. Times come
+# from the hosts' clocks, so a trace recorded or replayed on a
+# clock_3.VirtualClock is the same on every run.
+
+
+## Records every Host.udt_send of the attached hosts to a trace file
+class TraceRecorder:
+
+    ##@param path: trace file to create
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.lock = threading.Lock()
+        self.count = 0
+
+    ## record the sends of a host
+    def attach(self, host):
+        host.send_hook = self.record
+
+    ## Host.send_hook: write one send
+    def record(self, host, dst, data_S):
+        with self.lock:
+            self.writer.writerow(['%.6f' % host.clock.time(), host, dst, data_S])
+            self.count += 1
+
+    ## detach from the hosts and close the file
+    def close(self, host_L=()):
+        for host in host_L:
+            host.send_hook = None
+        self.file.close()
+
+
+## Replays a recorded trace through Host.udt_send.
+# Rows are read from disk one at a time, so traces larger than memory can be
+# replayed. Sends keep their recorded order and relative timing, scaled by
+# speed, on the clock of the replaying hosts: run() in a thread, or start()
+# to send from the clock's timers.
+class TraceReplayer:
+
+    ##@param host_D: {host name: Host} sending the recorded packets
+    # @param path: trace file written by TraceRecorder
+    # @param speed: replay speed relative to the recording, None to send as
+    #  fast as possible
+    # @param restamp: give generated traffic payloads a fresh send time so
+    #  receivers measure the latency of the replay
+    def __init__(self, host_D, path, speed=1.0, restamp=True):
+        self.host_D = host_D
+        self.path = path
+        self.speed = speed
+        self.restamp = restamp
+        self.sent = 0
+        self.skipped = 0    #rows for hosts not in host_D
+        self.sent_D = dict()    # {(destination, source, flow): generated traffic packets sent}
+        self.file = None
+        self.row_I = None   #rows not read yet
+        self.row = None     #next row to send
+        self.start_t = None #(recorded time, clock time) of the first row
+        self.end_t = None   #clock time of the last row
+        self.stop = False #for thread termination
+
+    ## called when printing the object
+    def __str__(self):
+        return 'Replay %s' % self.path
+
+    ## send one recorded row
+    def send(self, src, dst, data_S):
+        if src not in self.host_D:
+            self.skipped += 1
+            return
+        host = self.host_D[src]
+        traffic = network.parse_traffic_payload(data_S)
+        if traffic is not None:
+            key = (dst, str(traffic[0]), str(traffic[1]))
+            self.sent_D[key] = self.sent_D.get(key, 0) + 1
+            if self.restamp:
+                data_S = network.traffic_payload(traffic[0], traffic[1], traffic[2], len(data_S), host.clock.time())
+        host.udt_send(dst, data_S)
+        self.sent += 1
+
+    ## generated traffic packets replayed to dst, see traffic_3.sent_to
+    # @return {(source, flow): count}
+    def sent_to(self, dst):
+        return {(src, flow): count for (to, src, flow), count in self.sent_D.items() if to == dst}
+
+    ## clock of the replaying hosts
+    def clock(self):
+        return next(iter(self.host_D.values())).clock
+
+    ## open the trace and read its first row
+    def open(self):
+        self.file = open(self.path, newline='')
+        self.row_I = csv.reader(self.file)
+        self.row = next(self.row_I, None)
+        self.start_t = None
+
+    ## send the next row and read the one after it
+    # @return seconds until that row is due, None once the trace ended or
+    #  stop is set
+    def next_send(self):
+        if self.stop or self.row is None:
+            self.file.close()
+            return None
+        t_S, src, dst, data_S = self.row
+        now = self.clock().time()
+        if self.start_t is None:
+            self.start_t = (float(t_S), now)
+        self.send(src, dst, data_S)
+        self.row = next(self.row_I, None)
+        if self.row is None:
+            self.end_t = now
+            return 0
+        if self.speed is None:
+            return 0
+        return max(self.start_t[1] + (float(self.row[0]) - self.start_t[0]) / self.speed - now, 0)
+
+    ## replay on the hosts' clock from its timers instead of a thread
+    def start(self):
+        self.open()
+        self.clock().call_later(0, self.tick)
+
+    def tick(self):
+        gap = self.next_send()
+        if gap is not None:
+            self.clock().call_later(gap, self.tick)
+
+    ## thread target replaying the trace until it ends or stop is set
+    def run(self):
+        print (threading.currentThread().getName() + ': Starting')
+        self.open()
+        gap = self.next_send()
+        while gap is not None:
+            if gap > 0:
+                self.clock().sleep(gap)
+            gap = self.next_send()
+        print (threading.currentThread().getName() + ': Ending')
@@ -1,12 +1,16 @@
-import network
-import link
-import threading
-from time import sleep
+import network_3 as network
+import link_3 as link
+import snapshot_3 as snapshot
+import clock_3 as clock
+import controller_3 as controller
+import os
 import sys
 
 ##configuration parameters
 router_queue_size = 0 #0 means unlimited
 simulation_time = 10   #give the network sufficient time to execute transfers
+routing_snapshot = None #start from routing tables saved in this file; saved there after convergence if missing
+virtual_time = False    #step the network in this thread on a clock_3.VirtualClock instead of running it in threads
 
 if __name__ == '__main__':
     object_L = [] #keeps track of objects, so we can kill their threads at the end
@@ -59,33 +63,36 @@ if __name__ == '__main__':
     link_layer.add_link(link.Link(router_d, 1, host_3, 0))
     
     
-    #start all the objects
-    thread_L = []
-    for obj in object_L:
-        thread_L.append(threading.Thread(name=obj.__str__(), target=obj.run)) 
-    
-    for t in thread_L:
-        t.start()
-    
-    ## compute routing tables
-    router_a.send_routes(1) #one update starts the routing process
-    sleep(simulation_time+7)  #let the tables converge
-    print("Converged routing tables")
-    for obj in object_L:
-        if str(type(obj)) == "<class 'network.Router'>":
+    #print routing tables as they change, rendered away from the router threads
+    reporter = network.RouteReporter()
+    router_L = [obj for obj in object_L if isinstance(obj, network.Router)]
+    for obj in router_L:
+        obj.reporter = reporter
+
+    #start all the objects; leaving the with block stops and joins them all,
+    #also when a node or this script raises
+    ctl = controller.Controller(object_L, clock.VirtualClock() if virtual_time else clock.wall_clock)
+    with ctl:
+        ## compute routing tables
+        if routing_snapshot is not None and os.path.exists(routing_snapshot):
+            snapshot.restore(routing_snapshot, router_L)
+        else:
+            router_a.send_routes(1) #one update starts the routing process
+            ctl.sleep(simulation_time+7)  #let the tables converge
+            if routing_snapshot is not None:
+                snapshot.save(routing_snapshot, router_L)
+        for obj in router_L:
+            obj.reporter = None
+        reporter.close()
+        print("Converged routing tables")
+        for obj in router_L:
             obj.print_routes()
 
-    #send packet from host 1 to host 2
-    host_1.udt_send('H3', 'MESSAGE_FROM_H1')
-    host_3.udt_send('H1', 'MESSAGE_FROM_H3')
-    sleep(simulation_time+1)
-    
-    
-    #join all threads
-    for o in object_L:
-        o.stop = True
-    for t in thread_L:
-        t.join()
+        #send packet from host 1 to host 2
+        host_1.udt_send('H3', 'MESSAGE_FROM_H1')
+        host_3.udt_send('H1', 'MESSAGE_FROM_H3')
+        ctl.sleep(simulation_time+1)
         
     print("All simulation threads joined")
+    ctl.print_stats()
 
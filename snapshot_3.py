@@ -0,0 +1,173 @@
+import mmap
+import struct
+import sys
+from array import array
+
+## Binary snapshot of converged routing state.
+#
+# Layout (little-endian headers, arrays in native byte order):
+#   file header:   magic, version, byte order, router count
+#   router index:  (offset, length) of every router block
+#   router block:  block header with the destination, router and neighbor
+#                  counts and the length of the name block, the names
+#                  ('\n'-separated, padded to 8 bytes), then 8-byte aligned
+#                  arrays: direct costs, one cost row per router, next-hop
+#                  rows and fastest_D ports (-1 for none), all one entry per
+#                  destination.
+# A snapshot is read through mmap, so a single router's arrays can be
+# restored from a large topology without reading the rest of the file.
+
+magic = b'RTSN'
+version = 1
+file_header = struct.Struct('<4sIcxxxI')
+index_entry = struct.Struct('<QQ')
+block_header = struct.Struct('<IIII')
+
+
+## pad a byte string to a multiple of 8 bytes
+def pad8(byte_S):
+    return byte_S + b'\0' * (-len(byte_S) % 8)
+
+
+## copy a memoryview of 8-byte items into an array
+def to_array(typecode, view):
+    a = array(typecode)
+    if a.itemsize == view.itemsize:
+        a.frombytes(view.cast('B'))
+    else:
+        a.extend(view)
+    return a
+
+
+## encode the routing state of one router; holds route_lock so the router
+# thread cannot grow the table halfway through
+def encode_router(router):
+    tbl = router.rt_tbl
+    with router.route_lock:
+        n = len(tbl.dest_L)
+        neb_L = ['%s,%s' % (neb.name, '' if neb.port is None else neb.port) for neb in router.neb_routers]
+        name_S = pad8('\n'.join([router.name] + tbl.dest_L + tbl.router_L + neb_L).encode())
+        fastest = array('q', (router.fastest_D.get(dest, -1) for dest in tbl.dest_L))
+        part_L = [block_header.pack(n, len(tbl.router_L), len(neb_L), len(name_S)), name_S,
+                  tbl.direct.tobytes()]
+        part_L += [row.tobytes() for row in tbl.row_L]
+        part_L += [array('q', tbl.hop).tobytes(), fastest.tobytes()]
+    return b''.join(part_L)
+
+
+## write the routing state of all routers to path
+# @param router_L: list of Router objects
+def save(path, router_L):
+    block_L = [encode_router(router) for router in router_L]
+    offset = file_header.size + index_entry.size * len(block_L)
+    with open(path, 'wb') as f:
+        f.write(file_header.pack(magic, version, sys.byteorder[0].encode(), len(block_L)))
+        for block in block_L:
+            f.write(index_entry.pack(offset, len(block)))
+            offset += len(block)
+        for block in block_L:
+            f.write(block)
+
+
+## A memory-mapped snapshot file
+class Snapshot:
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        tag, file_version, byteorder, count = file_header.unpack_from(self.mm, 0)
+        if tag != magic or file_version != version:
+            raise ValueError('%s: not a routing snapshot (version %d)' % (path, file_version))
+        if byteorder != sys.byteorder[0].encode():
+            raise ValueError('%s: snapshot written with a different byte order' % path)
+        self.block_D = {}   # {router name: (offset, length)}
+        for i in range(count):
+            offset, length = index_entry.unpack_from(self.mm, file_header.size + i * index_entry.size)
+            name_length = block_header.unpack_from(self.mm, offset)[3]
+            name_start = offset + block_header.size
+            name = bytes(self.mm[name_start : name_start + name_length]).split(b'\n', 1)[0].decode()
+            self.block_D[name] = (offset, length)
+
+    ## names of the routers in the snapshot
+    def names(self):
+        return list(self.block_D)
+
+    ## zero-copy views of one router's state
+    # @return (dest_L, router_L, neb_L, direct, row_L, hop, fastest) with the
+    #  arrays as memoryviews into the mapped file; they must be released
+    #  before close()
+    def views(self, name):
+        offset, _ = self.block_D[name]
+        n, num_routers, num_neb, name_length = block_header.unpack_from(self.mm, offset)
+        pos = offset + block_header.size
+        name_L = bytes(self.mm[pos : pos + name_length]).rstrip(b'\0').decode().split('\n')
+        dest_L = name_L[1 : 1 + n]
+        router_L = name_L[1 + n : 1 + n + num_routers]
+        neb_L = name_L[1 + n + num_routers :]
+        pos += name_length
+        view = memoryview(self.mm)
+        def take(typecode):
+            nonlocal pos
+            part = view[pos : pos + 8 * n].cast(typecode)
+            pos += 8 * n
+            return part
+        direct = take('d')
+        row_L = [take('d') for _ in range(num_routers)]
+        return dest_L, router_L, neb_L, direct, row_L, take('q'), take('q')
+
+    ## load the saved state into a Router built with the same interfaces
+    def restore(self, router):
+        dest_L, router_L, neb_L, direct, row_L, hop, fastest = self.views(router.name)
+        try:
+            self.load(router, dest_L, router_L, neb_L, direct, row_L, hop, fastest)
+        finally:
+            for view in [direct, hop, fastest] + row_L:
+                view.release()
+
+    ## raise ValueError, leaving the router untouched, if the saved ports
+    # are not all interfaces of router
+    def load(self, router, dest_L, router_L, neb_L, direct, row_L, hop, fastest):
+        neb_port_L = []
+        for neb_S in neb_L:
+            name, port = neb_S.rsplit(',', 1)
+            neb_port_L.append((name, int(port) if port else None))
+        port_S = set(fastest) | set(port for _, port in neb_port_L)
+        port_S -= {-1, None}
+        missing_L = sorted(port for port in port_S if port not in router.intf_L)
+        if missing_L:
+            raise ValueError('%s: snapshot routes through ports %s, which the router has no interfaces for' % \
+                (router.name, missing_L))
+        tbl = router.rt_tbl
+        with router.route_lock:
+            tbl.dest_L = [sys.intern(dest) for dest in dest_L]
+            tbl.dest_D = {dest: j for j, dest in enumerate(tbl.dest_L)}
+            tbl.sorted_L = sorted(tbl.dest_L)
+            tbl.router_L = [sys.intern(name) for name in router_L]
+            tbl.router_D = {name: r for r, name in enumerate(tbl.router_L)}
+            tbl.direct = to_array('d', direct)
+            tbl.row_L = [to_array('d', row) for row in row_L]
+            tbl.hop = to_array('l', hop)
+            router.fastest_D = {dest: port for dest, port in zip(tbl.dest_L, fastest) if port >= 0}
+            router.neb_routers = [router.Intf_data(name, port) for name, port in neb_port_L]
+            if router.ecmp:
+                router.update_fastest(range(len(tbl.dest_L)))
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+## restore every router found in the snapshot at path
+# @param router_L: list of Router objects
+# @return names of the routers that were restored
+def restore(path, router_L):
+    snap = Snapshot(path)
+    try:
+        restored_L = []
+        for router in router_L:
+            if router.name in snap.block_D:
+                snap.restore(router)
+                restored_L.append(router.name)
+        return restored_L
+    finally:
+        snap.close()
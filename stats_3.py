@@ -0,0 +1,118 @@
+## Receive statistics kept by hosts: per-flow counts and latency of
+# generated traffic (see network_3.traffic_payload) and hop traces of
+# traced data packets.
+
+
+## Receive statistics for one (source, flow) pair of generated traffic
+class FlowStats:
+
+    def __init__(self):
+        self.received = 0
+        self.reordered = 0  #packets arriving after a higher sequence number
+        self.max_seq = -1
+        self.latency_sum = 0.0
+        self.latency_min = float('inf')
+        self.latency_max = 0.0
+
+    ## record one received packet
+    # @param latency: one-way latency in seconds
+    def record(self, seq, latency):
+        self.received += 1
+        if seq < self.max_seq:
+            self.reordered += 1
+        else:
+            self.max_seq = seq
+        self.latency_sum += latency
+        self.latency_min = min(self.latency_min, latency)
+        self.latency_max = max(self.latency_max, latency)
+
+    ## packets missing so far
+    # @param sent: packets the sender sent in this flow, see
+    #  traffic_3.sent_to; None to count only the gaps below the highest
+    #  sequence number received, which misses losses at the tail of the flow
+    def lost(self, sent=None):
+        if sent is not None:
+            return max(sent - self.received, 0)
+        return max(self.max_seq + 1 - self.received, 0)
+
+    ## one-line summary, with the loss against sent if given
+    def summary(self, sent=None):
+        loss_S = 'gap loss %d' % self.lost() if sent is None else 'sent %d, lost %d' % (sent, self.lost(sent))
+        if self.received == 0:
+            return 'received 0, %s' % loss_S
+        return 'received %d, %s, reordered %d, latency avg %.3f ms min %.3f ms max %.3f ms' % \
+            (self.received, loss_S, self.reordered, self.latency_sum / self.received * 1000,
+             self.latency_min * 1000, self.latency_max * 1000)
+
+    def __str__(self):
+        return self.summary()
+
+
+## Latency histogram with power-of-two microsecond buckets
+class LatencyHistogram:
+    num_buckets = 32
+
+    def __init__(self):
+        self.count_L = [0] * self.num_buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    ## add one sample
+    # @param latency: latency in seconds
+    def add(self, latency):
+        bucket = min(max(int(latency * 1e6), 1).bit_length() - 1, self.num_buckets - 1)
+        self.count_L[bucket] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    ## approximate latency below which a fraction q of the samples fall
+    def quantile(self, q):
+        seen = 0
+        for bucket, count in enumerate(self.count_L):
+            seen += count
+            if count and seen >= q * self.count:
+                return (2 ** (bucket + 1)) / 1e6
+        return 0.0
+
+    def __str__(self):
+        if self.count == 0:
+            return 'no samples'
+        return 'n %d, avg %.3f ms, p50 <%.3f ms, p99 <%.3f ms, max %.3f ms' % \
+            (self.count, self.total / self.count * 1000, self.quantile(0.5) * 1000,
+             self.quantile(0.99) * 1000, self.max * 1000)
+
+
+## Aggregates hop traces of received packets: end-to-end latency per flow,
+# the paths each flow took, and the delay between consecutive hops (queueing
+# in the out queue, the link and the next in queue).
+class TraceStats:
+
+    def __init__(self):
+        self.latency_D = dict()     # {(source, destination): LatencyHistogram}
+        self.path_D = dict()        # {(source, destination): {path: count}}
+        self.hop_D = dict()         # {(node, next node): LatencyHistogram}
+
+    ## record the trace of one received packet
+    # @param trace_L: [(node, timestamp)] from sender to receiver
+    def record(self, trace_L):
+        flow = (trace_L[0][0], trace_L[-1][0])
+        if flow not in self.latency_D:
+            self.latency_D[flow] = LatencyHistogram()
+            self.path_D[flow] = dict()
+        self.latency_D[flow].add(trace_L[-1][1] - trace_L[0][1])
+        path = tuple(node for node, _ in trace_L)
+        self.path_D[flow][path] = self.path_D[flow].get(path, 0) + 1
+        for (node_a, t_a), (node_b, t_b) in zip(trace_L, trace_L[1:]):
+            if (node_a, node_b) not in self.hop_D:
+                self.hop_D[(node_a, node_b)] = LatencyHistogram()
+            self.hop_D[(node_a, node_b)].add(t_b - t_a)
+
+    def print_stats(self, name):
+        for flow, hist in sorted(self.latency_D.items()):
+            print('%s: flow %s->%s latency: %s' % ((name,) + flow + (hist,)))
+            for path, count in sorted(self.path_D[flow].items()):
+                print('%s:     path %s: %d packets' % (name, '-'.join(path), count))
+        for hop, hist in sorted(self.hop_D.items()):
+            print('%s: hop %s->%s delay: %s' % ((name,) + hop + (hist,)))
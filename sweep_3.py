@@ -0,0 +1,174 @@
+import network_3 as network
+import link_3 as link
+import clock_3 as clock
+import ast
+import csv
+import itertools
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+## Parameter sweeps.
+# run_sweep() runs one simulation per combination of a parameter grid in a
+# pool of processes, one per core by default, and collects one row of
+# metrics per run into a single results table. Every run builds its own
+# ring of routers, each with one host, on a clock_3.VirtualClock: runs on
+# parallel processes do not compete for the time they measure, and a row
+# comes out the same however many run beside it. Links transmit at
+# link_rate, so bursts queue in the routers instead of arriving at one
+# instant, and loss and latency reflect the load on the ring.
+#
+#   python3 sweep_3.py routers=4,8,16 queue_size=0,4 max_cost=1,10 csv=results.csv
+
+##configuration parameters
+defaults = {
+    'routers': 8,       #routers in the ring, one host on each
+    'queue_size': 0,    #router interface queue length, 0 means unlimited
+    'max_cost': 1,      #ring link costs are drawn from 1..max_cost
+    'link_delay': 0.001,    #seconds packets spend on every link
+    'link_rate': 100000,    #characters per second every link direction transmits, None for no limit
+    'burst': 4,         #packets each host sends per interval
+    'interval': 0.01,   #seconds between bursts
+    'traffic_time': 1.0,    #seconds of traffic after the routes converged
+    'seed': 0,          #seed of the link costs
+}
+grid = {'routers': [4, 8, 16], 'queue_size': [0, 2, 8], 'max_cost': [1, 10]}
+settle_time = 60    #simulated seconds allowed for convergence and draining
+metric_L = ['converged', 'reachable', 'sent', 'delivered', 'loss', 'throughput', 'latency', 'wall']
+
+
+## build a ring of routers R1..Rn with host Hi on router Ri
+# @param link_rate: characters per second of every link, None for no limit
+# @param stub: also hang router RS with host HS off R1 on interface 3, the
+#  last router and host returned; cutting it off leaves the ring's cycle
+# @param router_kwargs: passed on to every Router
+# @return (list of hosts, list of routers, LinkLayer)
+def build_ring(routers, queue_size, max_cost, link_delay, seed, link_rate=None, stub=False, **router_kwargs):
+    if routers < 3:
+        raise ValueError('a ring needs at least 3 routers, not %d' % routers)
+    rnd = random.Random(seed)
+    cost_L = [rnd.randint(1, max_cost) for _ in range(routers)]  #cost of the link Ri - Ri+1
+    host_L = [network.Host('H%d' % (i + 1)) for i in range(routers)]
+    router_L = []
+    for i in range(routers):
+        cost_D = {'H%d' % (i + 1): {0: 1},
+                  'R%d' % ((i - 1) % routers + 1): {1: cost_L[i - 1]},
+                  'R%d' % ((i + 1) % routers + 1): {2: cost_L[i]}}
+        if stub and i == 0:
+            cost_D['RS'] = {3: 1}
+        router_L.append(network.Router(name='R%d' % (i + 1), cost_D=cost_D, max_queue_size=queue_size, **router_kwargs))
+    link_layer = link.LinkLayer()
+    for i in range(routers):
+        link_layer.add_link(link.Link(host_L[i], 0, router_L[i], 0, delay=link_delay, rate=link_rate))
+        link_layer.add_link(link.Link(router_L[i], 2, router_L[(i + 1) % routers], 1, delay=link_delay, rate=link_rate))
+    if stub:
+        host_L.append(network.Host('HS'))
+        router_L.append(network.Router(name='RS', cost_D={'R1': {0: 1}, 'HS': {1: 1}}, max_queue_size=queue_size,
+                                       **router_kwargs))
+        link_layer.add_link(link.Link(router_L[0], 3, router_L[-1], 0, delay=link_delay, rate=link_rate))
+        link_layer.add_link(link.Link(router_L[-1], 1, host_L[-1], 0, delay=link_delay, rate=link_rate))
+    return host_L, router_L, link_layer
+
+
+## run one simulation: converge the ring, then have every host send bursts
+# to the host opposite it
+# @param params: values overriding defaults
+# @return the parameters followed by the metrics of metric_L
+def simulate(params):
+    param_D = dict(defaults, **params)
+    start = time.perf_counter()
+    host_L, router_L, link_layer = build_ring(param_D['routers'], param_D['queue_size'], param_D['max_cost'],
+                                              param_D['link_delay'], param_D['seed'], link_rate=param_D['link_rate'])
+    clk = clock.VirtualClock()
+    clock.use(clk, host_L + router_L + [link_layer])
+    router_L[0].send_routes(1)  #one update starts the routing process
+    clk.sleep(settle_time)
+    converged = max(router.last_change_t for router in router_L)
+    routes = sum(str(host) in router.fastest_D for router in router_L for host in host_L)
+    seq_L = [0] * len(host_L)
+    for _ in range(int(round(param_D['traffic_time'] / param_D['interval']))):
+        for i, host in enumerate(host_L):
+            dst = host_L[(i + len(host_L) // 2) % len(host_L)]
+            for _ in range(param_D['burst']):
+                host.udt_send(str(dst), network.traffic_payload(host, 0, seq_L[i], 32, clk.time()))
+                seq_L[i] += 1
+        clk.sleep(param_D['interval'])
+    sent = sum(seq_L)
+    clk.sleep(settle_time)
+    stats_L = [stats for host in host_L for stats in host.rx_stats_D.values()]
+    delivered = sum(stats.received for stats in stats_L)
+    latency_sum = sum(stats.latency_sum for stats in stats_L)
+    row_D = dict(param_D)
+    row_D.update(converged=converged, reachable=routes / (len(router_L) * len(host_L)),
+                 sent=sent, delivered=delivered, loss=1 - delivered / sent if sent else 0.0,
+                 throughput=delivered / param_D['traffic_time'],
+                 latency=latency_sum / delivered * 1000 if delivered else None,
+                 wall=time.perf_counter() - start)
+    return row_D
+
+
+## keep pool workers from printing every packet
+def silence():
+    link.print_packets = False
+    sys.stdout = open(os.devnull, 'w')
+
+
+## every combination of the grid
+# @param grid_D: {parameter: [values]}
+# @return list of {parameter: value}
+def combinations(grid_D):
+    return [dict(zip(grid_D, value_L)) for value_L in itertools.product(*grid_D.values())]
+
+
+## run one simulation per grid combination
+# @param grid_D: {parameter: [values]}, parameters not given keep their
+#  default
+# @param processes: worker processes, one per core if None
+# @return result rows in grid order, as returned by simulate
+def run_sweep(grid_D, processes=None):
+    for name in grid_D:
+        if name not in defaults:
+            raise ValueError('unknown sweep parameter %s' % name)
+    with multiprocessing.Pool(processes, initializer=silence) as pool:
+        return pool.map(simulate, combinations(grid_D), chunksize=1)
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return '%.4g' % value
+    return '-' if value is None else str(value)
+
+## the result rows as an aligned text table
+# @param name_L: columns, every parameter and metric if None
+def to_text(row_L, name_L=None):
+    if name_L is None:
+        name_L = list(defaults) + metric_L
+    cell_L = [name_L] + [[format_value(row[name]) for name in name_L] for row in row_L]
+    width_L = [max(len(cells[c]) for cells in cell_L) for c in range(len(name_L))]
+    return ''.join(' '.join(cell.rjust(width) for cell, width in zip(cells, width_L)) + '\n' for cells in cell_L)
+
+## write the result rows to a CSV file
+def write_csv(path, row_L):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, list(defaults) + metric_L)
+        writer.writeheader()
+        writer.writerows(row_L)
+
+
+if __name__ == '__main__':
+    grid_D = dict(grid)
+    csv_path = None
+    for arg in sys.argv[1:]:
+        name, value_S = arg.split('=', 1)
+        if name == 'csv':
+            csv_path = value_S
+        else:
+            grid_D[name] = [ast.literal_eval(v) for v in value_S.split(',')]
+    start = time.perf_counter()
+    row_L = run_sweep(grid_D)
+    print('%d runs in %.2f s on %d processes' % (len(row_L), time.perf_counter() - start, os.cpu_count()))
+    sys.stdout.write(to_text(row_L, list(grid_D) + metric_L))
+    if csv_path is not None:
+        write_csv(csv_path, row_L)
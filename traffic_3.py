@@ -0,0 +1,164 @@
+import network_3 as network
+import threading
+import itertools
+import random
+
+## Inter-departure patterns: generators yielding the gap in seconds before
+# each next packet.
+
+## constant bit rate
+# @param rate: packets per second
+def constant_rate(rate, rnd=None):
+    return itertools.repeat(1.0 / rate)
+
+## Poisson arrivals (exponentially distributed gaps)
+# @param rate: mean packets per second
+def poisson(rate, rnd=None):
+    rnd = rnd or random.Random()
+    while True:
+        yield rnd.expovariate(rate)
+
+## bursty on/off source: constant rate while on, silent while off
+# @param rate: packets per second during a burst
+# @param on_time: burst length in seconds
+# @param off_time: silence between bursts in seconds
+def on_off(rate, on_time, off_time, rnd=None):
+    burst = max(int(rate * on_time), 1)
+    while True:
+        for _ in range(burst - 1):
+            yield 1.0 / rate
+        yield 1.0 / rate + off_time
+
+
+## Drives sustained load from one host.
+# Packets carry a per-destination sequence number and send timestamp (see
+# network.traffic_payload) so the receiving Host.udt_receive can compute
+# loss, reordering and one-way latency. Sends are paced by the host's clock:
+# run() is a thread target, start() schedules them with call_later instead,
+# which is how traffic runs on a clock_3.VirtualClock.
+class TrafficGenerator:
+
+    ##@param host: Host the traffic is sent from
+    # @param dst_L: destinations, sent to in turn
+    # @param pattern: iterator of inter-departure gaps, e.g. poisson(100)
+    # @param size: payload length, an int or a (min, max) range
+    # @param count: number of packets to send, None to send until stopped
+    # @param flow: flow id carried in the payload
+    # @param seed: seed for random packet sizes
+    def __init__(self, host, dst_L, pattern, size=64, count=None, flow=0, seed=None):
+        self.host = host
+        self.dst_L = list(dst_L)
+        self.pattern = pattern
+        self.size = size
+        self.count = count
+        self.flow = flow
+        self.rnd = random.Random(seed)
+        self.seq_D = dict.fromkeys(self.dst_L, 0)   # {destination: next sequence number}
+        self.departure_I = zip(itertools.cycle(self.dst_L), pattern)   # (destination, gap after it)
+        self.sent = 0
+        self.stop = False #for thread termination
+
+    ## called when printing the object
+    def __str__(self):
+        return 'Traffic %s-%s' % (self.host, self.flow)
+
+    ## payload length of the next packet
+    def next_size(self):
+        if isinstance(self.size, int):
+            return self.size
+        return self.rnd.randint(*self.size)
+
+    ## send one packet to dst
+    def send(self, dst):
+        data_S = network.traffic_payload(self.host, self.flow, self.seq_D[dst], self.next_size(), self.host.clock.time())
+        self.seq_D[dst] += 1
+        self.host.udt_send(dst, data_S)
+        self.sent += 1
+
+    ## send the next packet of the pattern
+    # @return seconds until the one after it, None once done or stopped
+    def next_send(self):
+        if self.stop or (self.count is not None and self.sent >= self.count):
+            return None
+        departure = next(self.departure_I, None)
+        if departure is None:
+            return None
+        self.send(departure[0])
+        return departure[1]
+
+    ## packets sent to dst, keyed like Host.rx_stats_D
+    # @return {(source, flow): count}
+    def sent_to(self, dst):
+        if dst not in self.seq_D:
+            return {}
+        return {(str(self.host), str(self.flow)): self.seq_D[dst]}
+
+    ## send on the host's clock from its timers instead of a thread
+    def start(self):
+        self.host.clock.call_later(0, self.tick)
+
+    ## attached to a clock by clock_3.use: a stepped clock starts sending
+    # from its timers, so start() is not called as well
+    def set_clock(self, clock):
+        if clock.stepped:
+            clock.call_later(0, self.tick)
+
+    ## sends happen in tick(), run by the clock's timers
+    def step(self):
+        return 0
+
+    def next_timer(self):
+        return None
+
+    def tick(self):
+        gap = self.next_send()
+        if gap is not None:
+            self.host.clock.call_later(gap, self.tick)
+
+    ## thread target sending packets according to the pattern
+    def run(self):
+        print (threading.currentThread().getName() + ': Starting')
+        clock = self.host.clock
+        next_t = clock.time()
+        gap = self.next_send()
+        while gap is not None:
+            next_t += gap
+            delay = next_t - clock.time()
+            if delay > 0:
+                clock.sleep(delay)
+            gap = self.next_send()
+        print (threading.currentThread().getName() + ': Ending')
+
+
+## packets a set of senders sent to one host, for stats_3.FlowStats.lost
+# @param sender_L: TrafficGenerator or replay_3.TraceReplayer objects
+# @param dst: name of the receiving host
+# @return {(source, flow): count}, keyed like Host.rx_stats_D
+def sent_to(sender_L, dst):
+    sent_D = {}
+    for sender in sender_L:
+        for key, count in sender.sent_to(dst).items():
+            sent_D[key] = sent_D.get(key, 0) + count
+    return sent_D
+
+
+## one generator per (source, destination) entry of a traffic matrix
+# @param host_D: {host name: Host}
+# @param rate_D: {source name: {destination name: packets per second}}
+# @param pattern: pattern function taking (rate, rnd=...), e.g. poisson
+# @param kwargs: passed on to TrafficGenerator
+def traffic_matrix(host_D, rate_D, pattern=constant_rate, seed=None, **kwargs):
+    rnd = random.Random(seed)
+    gen_L = []
+    for src, dst_D in sorted(rate_D.items()):
+        for flow, (dst, rate) in enumerate(sorted(dst_D.items())):
+            if rate > 0 and src != dst:
+                gen_L.append(TrafficGenerator(host_D[src], [dst], pattern(rate, rnd=random.Random(rnd.random())),
+                                              flow=flow, seed=rnd.random(), **kwargs))
+    return gen_L
+
+## all-to-all traffic: every host sends to every other host at the same rate
+def all_to_all(host_L, rate, pattern=constant_rate, **kwargs):
+    host_D = {str(host): host for host in host_L}
+    rate_D = {src: {dst: rate for dst in host_D if dst != src} for src in host_D}
+    return traffic_matrix(host_D, rate_D, pattern, **kwargs)
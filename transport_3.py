@@ -0,0 +1,314 @@
+import threading
+
+## Reliable transport over Host.udt_send.
+# Segments travel as ordinary data packets whose payload starts with
+# segment_tag:
+#   'R|D|source|port|seq|data'   data segment
+#   'R|F|source|port|seq|data'   last data segment of the stream
+#   'R|A|source|port|cum|sack'   acknowledgment: every segment below cum has
+#                                arrived, sack lists ','-separated segments
+#                                received above cum
+#   'R|E|source|port|cum|sack'   acknowledgment of a segment that arrived
+#                                marked congestion experienced (ECN echo)
+# Senders keep up to window segments outstanding and retransmit only the
+# segments whose timer ran out (selective repeat), with the retransmission
+# timeout adapted to the measured round-trip time; receivers buffer
+# out-of-order segments within the window and deliver the stream in order.
+# A congestion controller such as AIMD can further limit the window.
+# Times come from the host's clock; a sender runs either as a thread
+# (ReliableSender.run) or from the clock's timers (ReliableSender.start),
+# which is how it runs on a clock_3.VirtualClock.
+
+segment_tag = 'R|'
+max_sack = 16   #segment numbers reported per acknowledgment
+min_rto = 0.01  #bounds of the retransmission timeout in seconds
+max_rto = 5.0
+
+
+## parse a segment payload
+# @return (kind, source, port, number, rest) or None for other payloads,
+#  including ones that start with segment_tag but are not segments
+def parse_segment(data_S):
+    if not data_S.startswith(segment_tag):
+        return None
+    field_L = data_S[len(segment_tag):].split('|', 4)
+    if len(field_L) != 5 or field_L[0] not in ('D', 'F', 'A', 'E') or not field_L[3].isdigit():
+        return None
+    kind, src, port, number, rest = field_L
+    return kind, src, port, int(number), rest
+
+
+## Demultiplexes the segments received by a host to its senders and
+# receivers; installs itself as the host's receive_hook
+class Endpoint:
+
+    def __init__(self, host):
+        self.host = host
+        self.sender_D = dict()      # {(peer, port): ReliableSender}
+        self.receiver_D = dict()    # {port: ReliableReceiver}
+        host.receive_hook = self.receive
+
+    ## Host.receive_hook: hand a segment to its sender or receiver
+    # @param p: received NetworkPacket, only valid during the call
+    def receive(self, host, p):
+        segment = parse_segment(p.data_S)
+        if segment is None:
+            return
+        kind, src, port, number, rest = segment
+        if kind in 'AE':
+            sender = self.sender_D.get((src, port))
+            if sender is not None:
+                sender.ack(number, rest, kind == 'E')
+        else:
+            receiver = self.receiver_D.get(port)
+            if receiver is not None:
+                receiver.segment(src, number, rest, kind == 'F', p.ce)
+
+
+## Receives one stream per source on a port and acknowledges every segment
+class ReliableReceiver:
+
+    ##@param endpoint: Endpoint of the receiving host
+    # @param port: port the stream is sent to
+    # @param window: segments buffered ahead of the next expected one
+    # @param deliver: called as deliver(source, data_S) for in-order data
+    def __init__(self, endpoint, port=0, window=64, deliver=None):
+        self.endpoint = endpoint
+        self.port = str(port)
+        self.window = window
+        self.deliver = deliver
+        self.expected_D = dict()    # {source: next segment to deliver}
+        self.buffer_D = dict()      # {source: {segment: (data_S, last)}}
+        self.data_D = dict()        # {source: [data_S]} when deliver is None
+        self.done_S = set()         # sources whose last segment was delivered
+        self.received = 0
+        self.duplicates = 0
+        endpoint.receiver_D[self.port] = self
+
+    ## handle one data segment from src
+    # @param last: the segment ends the stream
+    # @param ce: the segment arrived marked congestion experienced
+    def segment(self, src, seq, data_S, last, ce=False):
+        self.received += 1
+        expected = self.expected_D.get(src, 0)
+        buffer_D = self.buffer_D.setdefault(src, dict())
+        if seq < expected or seq in buffer_D:
+            self.duplicates += 1
+        elif seq < expected + self.window:
+            buffer_D[seq] = (data_S, last)
+            while expected in buffer_D:
+                data_S, last = buffer_D.pop(expected)
+                expected += 1
+                if self.deliver is not None:
+                    self.deliver(src, data_S)
+                else:
+                    self.data_D.setdefault(src, []).append(data_S)
+                if last:
+                    self.done_S.add(src)
+            self.expected_D[src] = expected
+        sack_S = ','.join(str(s) for s in sorted(buffer_D)[:max_sack])
+        self.endpoint.host.udt_send(src, '%s%s|%s|%s|%d|%s' % \
+            (segment_tag, 'E' if ce else 'A', self.endpoint.host, self.port, expected, sack_S))
+
+    ## the stream received from src so far
+    def data(self, src):
+        return ''.join(self.data_D.get(src, []))
+
+
+## Additive-increase/multiplicative-decrease congestion window, in segments.
+# The window grows by one segment per acknowledged segment below ssthresh
+# (slow start) and by increase segments per window above it; a congestion
+# mark halves it (times decrease), a timeout restarts from one segment.
+class AIMD:
+
+    def __init__(self, increase=1.0, decrease=0.5, ssthresh=64.0):
+        self.increase = increase
+        self.decrease = decrease
+        self.ssthresh = ssthresh
+        self.cwnd = 1.0
+
+    ## segments that may be outstanding
+    def window(self):
+        return max(int(self.cwnd), 1)
+
+    ## acked segments were acknowledged without a congestion mark
+    def on_ack(self, acked):
+        for _ in range(acked):
+            if self.cwnd < self.ssthresh:
+                self.cwnd += 1
+            else:
+                self.cwnd += self.increase / self.cwnd
+
+    ## a congestion mark was echoed
+    def on_congestion(self):
+        self.ssthresh = max(self.cwnd * self.decrease, 1.0)
+        self.cwnd = self.ssthresh
+
+    ## a segment timed out, taken as loss
+    def on_timeout(self):
+        self.ssthresh = max(self.cwnd * self.decrease, 1.0)
+        self.cwnd = 1.0
+
+
+## Sends a byte string reliably to a ReliableReceiver
+class ReliableSender:
+
+    ##@param endpoint: Endpoint of the sending host
+    # @param dst: destination host
+    # @param data_S: data to send
+    # @param port: port of the receiver
+    # @param window: max segments outstanding
+    # @param timeout: initial retransmission timeout in seconds
+    # @param mss: max data characters per segment
+    # @param cc: congestion controller limiting the window, e.g. AIMD(); None
+    #  keeps window segments outstanding
+    def __init__(self, endpoint, dst, data_S, port=0, window=16, timeout=0.2, mss=256, cc=None):
+        self.endpoint = endpoint
+        self.dst = dst
+        self.port = str(port)
+        self.window = window
+        self.cc = cc
+        self.recover = 0    #congestion signals are ignored until base passes this
+        self.rto = timeout
+        self.srtt = None    #smoothed round-trip time
+        self.rttvar = None  #round-trip time variation
+        self.segment_L = [data_S[start : start + mss] for start in range(0, len(data_S), mss)] or ['']
+        self.base = 0           #first segment not cumulatively acknowledged
+        self.next_seq = 0       #next segment never sent
+        self.sent_D = dict()    # {outstanding segment: time last sent}
+        self.sacked_S = set()   #segments acknowledged above base
+        self.resent_S = set()   #outstanding segments sent more than once
+        self.sent = 0
+        self.retransmitted = 0
+        self.start_t = None
+        self.end_t = None
+        self.lock = threading.Condition()
+        self.stop = False #for thread termination
+        endpoint.sender_D[(dst, self.port)] = self
+
+    ## called when printing the object
+    def __str__(self):
+        return 'Sender %s-%s:%s' % (self.endpoint.host, self.dst, self.port)
+
+    ## every segment has been acknowledged
+    def done(self):
+        return self.base >= len(self.segment_L)
+
+    ## the current time of the host's clock
+    def now(self):
+        return self.endpoint.host.clock.time()
+
+    ## send or resend segment seq
+    def send(self, seq):
+        kind = 'F' if seq == len(self.segment_L) - 1 else 'D'
+        self.sent_D[seq] = self.now()
+        self.sent += 1
+        self.endpoint.host.udt_send(self.dst, '%s%s|%s|%s|%d|%s' % \
+            (segment_tag, kind, self.endpoint.host, self.port, seq, self.segment_L[seq]))
+
+    ## update the retransmission timeout from a round-trip sample (RFC 6298)
+    def sample_rtt(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, min_rto), max_rto)
+
+    ## a segment got acknowledged; segments sent once give an RTT sample
+    # @return 1 if seq was outstanding, else 0
+    def acked(self, seq, now):
+        sent_t = self.sent_D.pop(seq, None)
+        if sent_t is None:
+            return 0
+        if seq in self.resent_S:
+            self.resent_S.discard(seq)
+        else:
+            self.sample_rtt(now - sent_t)
+        return 1
+
+    ## segments that may be outstanding
+    def limit(self):
+        if self.cc is None:
+            return self.window
+        return min(self.window, self.cc.window())
+
+    ## handle an acknowledgment from the receiver
+    # @param cum: every segment below cum has arrived
+    # @param sack_S: ','-separated segments received above cum
+    # @param ece: the receiver got a segment marked congestion experienced
+    def ack(self, cum, sack_S, ece=False):
+        now = self.now()
+        with self.lock:
+            acked = 0
+            for seq in range(self.base, cum):
+                acked += self.acked(seq, now)
+            self.base = max(self.base, cum)
+            for seq in sack_S.split(',') if sack_S else ():
+                seq = int(seq)
+                if seq >= self.base:
+                    self.sacked_S.add(seq)
+                    acked += self.acked(seq, now)
+            if self.cc is not None:
+                if ece and self.base >= self.recover:
+                    #react once per window of data
+                    self.cc.on_congestion()
+                    self.recover = self.next_seq
+                elif not ece:
+                    self.cc.on_ack(acked)
+            self.sacked_S = set(seq for seq in self.sacked_S if seq >= self.base)
+            if self.done() and self.end_t is None:
+                self.end_t = now
+            self.send_new()     #acknowledgments open the window
+            self.lock.notify()
+
+    ## goodput in data characters per second, None until done
+    def goodput(self):
+        if self.end_t is None:
+            return None
+        return sum(map(len, self.segment_L)) / (self.end_t - self.start_t)
+
+    ## send the segments the window allows that were never sent
+    def send_new(self):
+        while self.next_seq < len(self.segment_L) and self.next_seq < self.base + self.limit():
+            self.send(self.next_seq)
+            self.next_seq += 1
+
+    ## resend the segments whose timer ran out, then fill the window; called
+    # with lock held
+    def poll(self):
+        now = self.now()
+        expired_L = [seq for seq, sent_t in self.sent_D.items() if now - sent_t >= self.rto]
+        if expired_L:
+            self.rto = min(self.rto * 2, max_rto)   #back off until acknowledgments return
+            if self.cc is not None and self.base >= self.recover:
+                self.cc.on_timeout()
+                self.recover = self.next_seq
+        for seq in expired_L:
+            self.retransmitted += 1
+            self.resent_S.add(seq)
+            self.send(seq)
+        self.send_new()
+
+    ## send from the timers of the host's clock instead of a thread
+    def start(self):
+        self.start_t = self.now()
+        self.tick()
+
+    def tick(self):
+        with self.lock:
+            if self.stop or self.done():
+                return
+            self.poll()
+            self.endpoint.host.clock.call_later(self.rto / 4, self.tick)
+
+    ## thread target sending until every segment is acknowledged or stop is set
+    def run(self):
+        print (threading.currentThread().getName() + ': Starting')
+        self.start_t = self.now()
+        with self.lock:
+            while not self.stop and not self.done():
+                self.poll()
+                self.lock.wait(self.rto / 4)
+        print (threading.currentThread().getName() + ': Ending')